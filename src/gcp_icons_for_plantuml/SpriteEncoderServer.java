@@ -0,0 +1,104 @@
+// SPDX-License-Identifier: MIT
+//
+// Long-lived sprite encoder used by gcp_icons_for_plantuml.encoder.
+//
+// Started once per build worker with the JDK source launcher:
+//
+//   java -cp scripts/plantuml.jar SpriteEncoderServer.java
+//
+// It reads one request per line on stdin, "<level>\t<name>\t<png path>"
+// (e.g. "16z\tai_platform\tdist/ai_platform/ai_platform.png"), where the path
+// may instead be "base64:" followed by the PNG's bytes, and answers
+// with exactly what `java -jar plantuml.jar -encodesprite <level> <png>`
+// prints, followed by a line holding only the end marker. A failed request
+// answers with the error marker and a message instead. The process exits
+// when stdin is closed.
+
+import java.awt.image.BufferedImage;
+import java.io.BufferedReader;
+import java.io.ByteArrayInputStream;
+import java.io.File;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.StandardCharsets;
+import java.util.Base64;
+import javax.imageio.ImageIO;
+
+public class SpriteEncoderServer {
+    static final String READY_MARKER = "@@READY@@";
+    static final String END_MARKER = "@@END@@";
+    static final String ERROR_MARKER = "@@ERROR@@";
+
+    // SpriteUtils and SpriteGrayLevel have moved between packages across PlantUML releases.
+    static final String[] SPRITE_PACKAGES = {
+        "net.sourceforge.plantuml.klimt.sprite",
+        "net.sourceforge.plantuml.sprite",
+        "net.sourceforge.plantuml.ugraphic.sprite",
+    };
+
+    public static void main(String[] args) throws Exception {
+        System.setProperty("java.awt.headless", "true");
+        // The same entry points `-encodesprite` calls (see Run.encodeSprite)
+        final String pkg = findSpritePackage();
+        final Class<?> utils = Class.forName(pkg + ".SpriteUtils");
+        final Class<?> grayLevels = Class.forName(pkg + ".SpriteGrayLevel");
+        final Method encode = utils.getMethod("encode", BufferedImage.class, String.class, grayLevels);
+        final Method encodeCompressed = utils.getMethod("encodeCompressed", BufferedImage.class, String.class, grayLevels);
+
+        final BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        final PrintStream out = new PrintStream(System.out, false, "UTF-8");
+        out.println(READY_MARKER);
+        out.flush();
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isEmpty()) {
+                continue;
+            }
+            try {
+                final String[] parts = line.split("\t", 3);
+                final String level = parts[0].toLowerCase();
+                final boolean compressed = level.endsWith("z");
+                final String gray = level.startsWith("8") ? "GRAY_8" : level.startsWith("4") ? "GRAY_4" : "GRAY_16";
+                final Object grayLevel = grayLevels.getField(gray).get(null);
+                final BufferedImage im = parts[2].startsWith("base64:")
+                    ? ImageIO.read(new ByteArrayInputStream(Base64.getDecoder().decode(parts[2].substring(7))))
+                    : ImageIO.read(new File(parts[2]));
+                final Object sprite = (compressed ? encodeCompressed : encode).invoke(null, im, spriteName(parts[1]), grayLevel);
+                out.println(sprite);
+            } catch (InvocationTargetException e) {
+                out.println(ERROR_MARKER + " " + e.getCause());
+            } catch (Exception e) {
+                out.println(ERROR_MARKER + " " + e);
+            }
+            out.println(END_MARKER);
+            out.flush();
+        }
+    }
+
+    static String findSpritePackage() throws ClassNotFoundException {
+        for (String pkg : SPRITE_PACKAGES) {
+            try {
+                Class.forName(pkg + ".SpriteUtils");
+                return pkg;
+            } catch (ClassNotFoundException e) {
+                // try the next known location
+            }
+        }
+        throw new ClassNotFoundException("SpriteUtils not found in plantuml.jar");
+    }
+
+    // `-encodesprite` names the sprite after the file: its leading letters, digits and underscores
+    static String spriteName(String name) {
+        final StringBuilder sb = new StringBuilder();
+        for (char c : name.toCharArray()) {
+            if (!("" + c).matches("[\\p{L}0-9_]")) {
+                break;
+            }
+            sb.append(c);
+        }
+        return sb.length() == 0 ? "test" : sb.toString();
+    }
+}
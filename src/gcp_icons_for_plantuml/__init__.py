@@ -0,0 +1,8 @@
+__all__ = ["Library", "build_library"]
+
+def __getattr__(name):
+    # Loaded on first use so the CLI doesn't import Pillow and NumPy at startup
+    if name in __all__:
+        from . import library
+        return getattr(library, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,145 @@
+import html
+import io
+import json
+import math
+from pathlib import Path
+
+from PIL import Image, features
+
+from .publish import write_file
+
+ATLAS_NAME = "atlas"
+ATLAS_ICON_SIZE = 64
+GALLERY_DIR = "gallery"
+GALLERY_PAGE_SIZE = 100
+
+def write_atlas(records, dist_path, icon_size=ATLAS_ICON_SIZE, thumbnails=None):
+    """
+    Pack every icon into one image, dist/atlas.png (plus atlas.webp when
+    Pillow has WebP support), and write dist/atlas.json with each icon's
+    position. Icons are scaled to fit `icon_size` and packed onto shelves.
+    A long-lived caller can pass a `thumbnails` dict to keep the scaled
+    icons between calls; they're keyed by the PNG's sha256 from the record.
+    Returns the coordinates as written to atlas.json.
+    """
+    dist_path = Path(dist_path)
+    records = sorted(records, key=lambda r: (r["category"], r["target"]))
+    images = load_thumbnails(records, dist_path, icon_size, thumbnails)
+
+    # Shelf packing, tallest first, into a roughly square sheet
+    order = sorted(range(len(images)), key=lambda i: -images[i].height)
+    sheet_width = max([icon_size] + [im.width for im in images])
+    sheet_width = max(sheet_width, math.ceil(math.sqrt(sum(im.width * im.height for im in images))))
+    positions = {}
+    x = y = shelf_height = 0
+    for i in order:
+        im = images[i]
+        if x + im.width > sheet_width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        positions[i] = (x, y)
+        x += im.width
+        shelf_height = max(shelf_height, im.height)
+    sheet_height = y + shelf_height
+
+    sheet = Image.new("RGBA", (sheet_width, max(1, sheet_height)), (0, 0, 0, 0))
+    icons = {}
+    for i, record in enumerate(records):
+        x, y = positions[i]
+        sheet.paste(images[i], (x, y))
+        icons[record["target"]] = {
+            "category": record["category"],
+            "x": x,
+            "y": y,
+            "width": images[i].width,
+            "height": images[i].height,
+        }
+
+    files = {"png": f"{ATLAS_NAME}.png"}
+    _save(sheet, dist_path / files["png"], "PNG")
+    if features.check("webp"):
+        files["webp"] = f"{ATLAS_NAME}.webp"
+        _save(sheet, dist_path / files["webp"], "WEBP", lossless=True)
+    atlas = {"images": files, "width": sheet_width, "height": sheet_height, "icon_size": icon_size, "icons": icons}
+    write_file(dist_path / f"{ATLAS_NAME}.json", json.dumps(atlas, indent=1).encode("utf-8"))
+    return atlas
+
+def load_thumbnails(records, dist_path, icon_size=ATLAS_ICON_SIZE, thumbnails=None):
+    """
+    Each record's PNG in `dist_path` scaled to fit `icon_size`, reusing and
+    filling `thumbnails` when it's given.
+    """
+    images = []
+    for record in records:
+        key = (record["sha256"].get(record["png"]), icon_size)
+        if thumbnails is not None and key in thumbnails:
+            images.append(thumbnails[key])
+            continue
+        with Image.open(Path(dist_path) / record["png"]) as im:
+            im = im.convert("RGBA")
+            im.thumbnail((icon_size, icon_size))
+            images.append(im)
+        if thumbnails is not None and key[0]:
+            thumbnails[key] = im
+    return images
+
+def write_gallery(atlas, dist_path, page_size=GALLERY_PAGE_SIZE):
+    """
+    Write dist/gallery/index.html, page-2.html, ... showing `page_size` icons
+    each, all drawn from the atlas image with CSS background offsets.
+    """
+    out_dir = Path(dist_path) / GALLERY_DIR
+    out_dir.mkdir(parents=True, exist_ok=True)
+    names = list(atlas["icons"])
+    pages = max(1, math.ceil(len(names) / page_size))
+    image = f"../{atlas['images']['png']}"
+    background = f"url({image})"
+    if "webp" in atlas["images"]:
+        background = f"image-set(url(../{atlas['images']['webp']}) type(\"image/webp\"), url({image}) type(\"image/png\"))"
+
+    for stale in out_dir.glob("page-*.html"):
+        if stale.name not in {_page_file(p) for p in range(2, pages + 1)}:
+            stale.unlink()
+
+    for page in range(1, pages + 1):
+        cells = []
+        for name in names[(page - 1) * page_size:page * page_size]:
+            icon = atlas["icons"][name]
+            cells.append(
+                f'<figure><div class="icon" style="width:{icon["width"]}px;height:{icon["height"]}px;'
+                f'background-position:-{icon["x"]}px -{icon["y"]}px"></div>'
+                f'<figcaption>{html.escape(name)}<br><small>{html.escape(icon["category"])}</small></figcaption></figure>'
+            )
+        nav = " ".join(
+            f"<b>{p}</b>" if p == page else f'<a href="{_page_file(p)}">{p}</a>' for p in range(1, pages + 1)
+        )
+        write_file(out_dir / _page_file(page), f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>GCP Symbols ({page}/{pages})</title>
+<style>
+body {{ font-family: sans-serif; }}
+main {{ display: flex; flex-wrap: wrap; gap: 8px; }}
+figure {{ width: 160px; margin: 0; text-align: center; font-size: 12px; }}
+.icon {{ margin: 0 auto; background-image: url({image}); background-image: {background}; }}
+</style>
+</head>
+<body>
+<h1>GCP Symbols</h1>
+<nav>{nav}</nav>
+<main>
+{chr(10).join(cells)}
+</main>
+<nav>{nav}</nav>
+</body>
+</html>
+""".encode("utf-8"))
+    return pages
+
+def _save(image, path, fmt, **params):
+    out = io.BytesIO()
+    image.save(out, fmt, **params)
+    write_file(path, out.getvalue())
+
+def _page_file(page):
+    return "index.html" if page == 1 else f"page-{page}.html"
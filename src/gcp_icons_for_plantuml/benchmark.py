@@ -0,0 +1,191 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import builder
+from .bundler import bundle
+from .encoder import PLANTUML_JAR
+from .kitchen_sink import generate_complex_diagram, generate_kitchen_sync_example
+from .manifest import load_manifest
+from .profiling import Profiler
+
+RESULTS_VERSION = 1
+DEFAULT_GRID_SIZES = (5, 10, 20)
+DEFAULT_NODE_COUNTS = (50, 100, 200)
+STRATEGY_ICONS = 25
+SCRATCH_DIRS = ("source", "scripts", "dist")
+
+# Nothing a bare `--help` should import
+HEAVY_MODULES = ("PIL", "numpy", "yaml", "requests", "multiprocessing", "concurrent.futures")
+
+def run_suite(grid_sizes=DEFAULT_GRID_SIZES, node_counts=DEFAULT_NODE_COUNTS, repeat=1, render=True, jobs=None):
+    """
+    Time the build (cold and warm), the per-icon resize, encode and write
+    steps, and, when java and plantuml.jar are available, how long PlantUML
+    takes to render the kitchen sink, complex diagrams and each include
+    strategy. Everything runs in a scratch copy of the tree (see
+    `scratch_tree`); the diagrams are thrown away with it.
+    Returns the results in the format `write_results` stores.
+    """
+    render = render and _can_render()
+    with scratch_tree():
+        return _run_suite(Path("benchmark"), grid_sizes, node_counts, repeat, render, jobs)
+
+@contextmanager
+def scratch_tree(dirs=SCRATCH_DIRS):
+    """
+    Work in a temporary copy of source/, scripts/ and dist/, so the builds
+    being timed never touch the real dist/, .cache/ or published generations.
+    """
+    cwd = Path.cwd()
+    with tempfile.TemporaryDirectory(prefix="gcp-icons-benchmark-") as tmp:
+        for name in dirs:
+            if (cwd / name).is_dir():
+                shutil.copytree(cwd / name, Path(tmp) / name)
+        os.chdir(tmp)
+        try:
+            yield Path(tmp)
+        finally:
+            os.chdir(cwd)
+
+def _run_suite(out_dir, grid_sizes, node_counts, repeat, render, jobs):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    metrics = {}
+
+    metrics["cli.help"] = _metric(startup_time(repeat=max(3, repeat)))
+
+    # Build: cold wipes dist/ and skips the cache, warm should be all hits
+    profiler = Profiler(enabled=True)
+    metrics["build.cold"] = _metric(_best_of(repeat, lambda: builder.build_all(
+        clean=True, use_cache=False, profiler=profiler, jobs=jobs)))
+    metrics["build.warm"] = _metric(_best_of(repeat, lambda: builder.build_all(jobs=jobs)))
+    for step in ("resize", "encode", "write"):
+        walls = sorted(t["wall"] for t in profiler.icons if t["step"] == step)
+        if walls:
+            metrics[f"icon.{step}.mean"] = _metric(sum(walls) / len(walls))
+            metrics[f"icon.{step}.p95"] = _metric(walls[int(len(walls) * 0.95) - 1])
+
+    # Render cost as the diagrams grow
+    for n in grid_sizes:
+        generate_kitchen_sync_example(n, out_dir)
+        diagram = out_dir / f"kitchen-sync-{n}x{n}.puml"
+        if render:
+            metrics[f"render.kitchen_sink.{n}x{n}"] = _metric(_best_of(repeat, lambda: _render(diagram)))
+    for n in node_counts:
+        diagram = out_dir / f"complex-{n}.puml"
+        shutil.move(generate_complex_diagram(out_dir, num_nodes=n, seed=n), diagram)
+        if render:
+            metrics[f"render.complex.{n}"] = _metric(_best_of(repeat, lambda: _render(diagram)))
+
+    # The same diagram pulling its icons in three ways
+    for strategy, diagram in _strategy_diagrams(out_dir).items():
+        metrics[f"include.{strategy}.bytes"] = _metric(_include_bytes(diagram), unit="bytes")
+        if render:
+            metrics[f"render.include.{strategy}"] = _metric(_best_of(repeat, lambda: _render(diagram)))
+
+    return {
+        "version": RESULTS_VERSION,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "render": render,
+            "repeat": repeat,
+        },
+        "metrics": metrics,
+    }
+
+def startup_time(repeat=5):
+    """Fastest wall time of `python -m gcp_icons_for_plantuml --help` in a fresh interpreter."""
+    cmd = [sys.executable, "-m", "gcp_icons_for_plantuml", "--help"]
+    return _best_of(repeat, lambda: subprocess.run(cmd, capture_output=True, check=True))
+
+def startup_imports():
+    """Heavy modules a bare `--help` imports; should be empty."""
+    cmd = [sys.executable, "-X", "importtime", "-m", "gcp_icons_for_plantuml", "--help"]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    imported = {line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines() if "|" in line}
+    return sorted(m for m in imported if m in HEAVY_MODULES)
+
+def write_results(results, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=1, sort_keys=True) + "\n", encoding="utf-8")
+
+def load_results(path):
+    results = json.loads(Path(path).read_text(encoding="utf-8"))
+    if results.get("version") != RESULTS_VERSION:
+        raise ValueError(f"{path} has results version {results.get('version')}, expected {RESULTS_VERSION}.")
+    return results
+
+def compare(results, baseline, tolerance=0.10):
+    """
+    Compare every metric present in both runs; lower is better for all of them.
+    Returns (rows, regressions) where each row is (name, baseline, current, change)
+    and regressions are the rows that grew by more than `tolerance`.
+    """
+    rows = []
+    for name, metric in sorted(results["metrics"].items()):
+        base = baseline["metrics"].get(name)
+        if not base or base["unit"] != metric["unit"]:
+            continue
+        change = (metric["value"] - base["value"]) / base["value"] if base["value"] else 0.0
+        rows.append((name, base["value"], metric["value"], change))
+    regressions = [row for row in rows if row[3] > tolerance]
+    return rows, regressions
+
+def _metric(value, unit="s"):
+    return {"value": round(value, 6), "unit": unit}
+
+def _best_of(repeat, fn):
+    best = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _can_render():
+    return PLANTUML_JAR.is_file() and shutil.which("java") is not None
+
+def _render(diagram):
+    subprocess.run(["java", "-jar", str(PLANTUML_JAR), "-tpng", str(diagram)], capture_output=True, check=True)
+
+def _strategy_diagrams(out_dir):
+    """Write one diagram per include strategy, all using the same icons."""
+    manifest = load_manifest(Path("dist"))
+    entries = manifest["icons"][::max(1, len(manifest["icons"]) // STRATEGY_ICONS)][:STRATEGY_ICONS]
+    body = "\nLAYOUT_LEFT_RIGHT\n\n"
+    for i, entry in enumerate(entries):
+        body += f"{entry['target']}(icon_{i}, \"{entry['target']}\", \"Technology\")\n"
+    body += "\n@enduml\n"
+
+    includes = {
+        "per_icon": ["../dist/GCPCommon.puml"] + [f"../dist/{e['puml']}" for e in entries],
+        "category": ["../dist/GCPCommon.puml"] + sorted({
+            f"../dist/{manifest['categories'][e['category']]['all']}" for e in entries}),
+        "bundle": ["strategy-bundle.include.puml"],
+    }
+    diagrams = {}
+    for strategy, files in includes.items():
+        diagram = out_dir / f"strategy-{strategy}.puml"
+        header = f"@startuml Strategy-{strategy}\n\n" + "".join(f"!include {f}\n" for f in files)
+        diagram.write_text(header + body, encoding="utf-8")
+        diagrams[strategy] = diagram
+    bundle([diagrams["per_icon"]], out_dir / "strategy-bundle.include.puml")
+    return diagrams
+
+def _include_bytes(diagram):
+    """Bytes of PlantUML source the diagram pulls in through its includes."""
+    total = 0
+    for line in diagram.read_text(encoding="utf-8").splitlines():
+        if line.startswith("!include "):
+            total += (diagram.parent / line.split(None, 1)[1]).stat().st_size
+    return total
@@ -1,14 +1,26 @@
+import hashlib
+import re
 import shutil
 import os
 import sys
-import multiprocessing
 import subprocess
 from pathlib import Path
-from multiprocessing import Pool
-import yaml
+from collections import Counter
+from functools import partial
+from itertools import groupby
 
+from . import config as config_module
+from . import publish
+from .atlas import ATLAS_NAME, GALLERY_DIR, write_atlas, write_gallery
+from .cache import BuildCache, SpriteCache
+from .encoder import EncoderError, check_jar_encoder, resolve_backend
 from .env import verify  # optional: if you want to re-check before building
-from .icon import Icon
+from .icon import Icon, SPRITE_SOURCE_SUFFIX
+from .manifest import (BINARY_MANIFEST_NAME, MANIFEST_NAME, MANIFEST_VERSION, duplicate_clusters, load_manifest,
+                       write_manifest)
+from .profiling import Profiler, timed
+from .publish import write_file
+from .scheduler import default_jobs, run_pipeline
 
 MARKDOWN_PREFIX_TEMPLATE = """# GCP Symbols
 
@@ -19,67 +31,345 @@ Category | PUML Macro (Name) | Image (PNG) | PUML Url |
 PUML_COPYRIGHT = """'SPDX-License-Identifier: MIT
 """
 
-def build_all():
+SPRITE_LEVEL = "16z"
+SPRITE_HEADER_RE = re.compile(r"^sprite \$(\w+) \[(\d+)x(\d+)/(\w+)\]", re.M)
+
+def build_all(encoder="auto", clean=False, use_cache=True, binary_manifest=False, profiler=None, jobs=None,
+              gallery=False, optimise_sprites=False, keep_generations=publish.KEEP_GENERATIONS):
     # Optionally re-check env:
     # verify()
+    profiler = profiler or Profiler()
 
     # Load config
-    config = _load_config()
+    with profiler.stage("config"):
+        config = _load_config()
+
+    # Previous build state; without it we can't tell what's stale, so start clean
+    cache = BuildCache()
+    state = {} if clean else cache.load_state()
 
-    # Clear dist/
-    dist_path = Path("dist")
-    if dist_path.exists():
-        shutil.rmtree(dist_path)
-    dist_path.mkdir()
+    # Build into a staging tree that starts as hard links to the published
+    # files, then swap it in for dist/ whole, so readers never see a half-built tree.
+    published = Path("dist")
+    dist_path = publish.stage(published, reuse=bool(state))
 
     # Copy .puml files from source/
     for puml_file in Path("source").glob("*.puml"):
-        shutil.copy(puml_file, dist_path)
+        write_file(dist_path / puml_file.name, puml_file.read_bytes())
 
     # Gather icons
-    icons = _collect_icons(config)
+    with profiler.stage("collect"):
+        icons = _collect_icons(config)
 
     # Create category folders
     categories = sorted({icon.category for icon in icons})
     for c in categories:
         (dist_path / c).mkdir(exist_ok=True)
 
-    # Generate images and puml concurrently
-    with Pool(processes=multiprocessing.cpu_count()) as pool:
-        pool.map(_process_icon, icons)
+    # Reuse cached outputs where the source, config entry and render params are unchanged
+    variants = image_variants(config)
+    params = render_params(variants, encoder, optimise_sprites)
+    with profiler.stage("cache_lookup"):
+        previous_manifest = _load_previous_manifest(dist_path)
+        previous = {entry["source"]: entry for entry in previous_manifest["icons"]}
+        records = {}
+        new_state = {}
+        misses = []
+        changed = set()
+        for icon in icons:
+            source = str(icon.file_path)
+            key = cache.key(icon, params)
+            outputs = [f.relative_to(dist_path).as_posix() for f in icon_outputs(icon, dist_path, variants)]
+            entry = {"key": key, "outputs": outputs}
+            new_state[source] = entry
+            if not use_cache:
+                misses.append((icon, key))
+            elif state.get(source) == entry and all((dist_path / o).exists() for o in outputs):
+                cache.hits += 1
+                records[source] = previous.get(source) or cache.meta(key)
+            elif cache.lookup(key):
+                records[source] = cache.restore(key, dist_path / icon.category)
+                cache.hits += 1
+                changed.add(icon.category)
+            else:
+                misses.append((icon, key))
+
+    # Drop outputs of icons that were removed or renamed
+    with profiler.stage("cleanup"):
+        current_outputs = {o for entry in new_state.values() for o in entry["outputs"]}
+        for entry in state.values():
+            for o in entry["outputs"]:
+                if o not in current_outputs and (dist_path / o).exists():
+                    (dist_path / o).unlink()
+                    changed.add(Path(o).parent.name)
+        for c in changed - set(categories):
+            category_path = dist_path / c
+            if category_path.is_dir():
+                shutil.rmtree(category_path)
+
+    by_category = {}
+    for record in records.values():
+        by_category.setdefault(record["category"], []).append(record)
+    category_files = {}
+    pending = Counter(icon.category for icon, _ in misses)
+
+    def finish_category(c):
+        # Create the category's all.puml if it changed, noting where each sprite landed
+        with profiler.stage("all_puml"):
+            all_file = dist_path / c / "all.puml"
+            category_records = by_category.get(c, [])
+            stale = any(r["source"] not in previous for r in category_records)
+            if c in changed or stale or c not in previous_manifest["categories"] or not all_file.exists():
+                digest = create_category_all_file(dist_path / c, category_records)
+                category_files[c] = {"all": f"{c}/all.puml", "sha256": digest}
+            else:
+                for record in category_records:
+                    record["sprite"].update(previous[record["source"]]["sprite"])
+                category_files[c] = previous_manifest["categories"][c]
 
-    # Create an all.puml per category
     for c in categories:
-        _create_category_all_file(dist_path / c)
+        if not pending[c]:
+            finish_category(c)
+
+    # Render cache misses through the resize -> encode pipeline; each category's
+    # all.puml is written as soon as its last icon lands
+    keys = {str(icon.file_path): key for icon, key in misses}
+    failures = []
+
+    def on_result(icon, result):
+        record, timings = result
+        profiler.add_icon_timings(timings)
+        cache.misses += 1
+        cache.store(keys[record["source"]], icon_outputs(icon, dist_path, variants), record)
+        records[record["source"]] = record
+        by_category.setdefault(icon.category, []).append(record)
+        icon_done(icon)
+
+    def on_error(icon, stage, e):
+        failures.append({"source": str(icon.file_path), "target": icon.target, "stage": stage, "error": str(e)})
+        # Drop its partial or stale outputs and forget it so the next build retries it
+        for f in icon_outputs(icon, dist_path, variants):
+            f.unlink(missing_ok=True)
+        new_state.pop(str(icon.file_path), None)
+        icon_done(icon)
 
-    # Generate Markdown sheet
-    _generate_markdown(icons, dist_path)
+    def icon_done(icon):
+        changed.add(icon.category)
+        pending[icon.category] -= 1
+        if not pending[icon.category]:
+            finish_category(icon.category)
 
+    if misses and encoder == "jar":
+        # Fail once here rather than once per icon in the workers
+        _check_jar_encoder()
+
+    jobs = jobs or default_jobs()
+    stages = [
+        ("resize", partial(resize_icon, variants=variants), jobs),
+        ("encode", partial(encode_icon, variants=variants, encoder=encoder, use_cache=use_cache,
+                           optimise=optimise_sprites), _encode_jobs(jobs, encoder)),
+        ("write", partial(_write_icon, dist_path=dist_path), jobs),
+    ]
+    with profiler.stage("render"):
+        run_pipeline([icon for icon, _ in misses], stages, on_result, on_error, profiler=profiler)
+
+    # Generate Markdown sheet and the manifest every consumer reads instead of dist/
+    if changed or not (dist_path / "GCPSymbols.md").exists():
+        with profiler.stage("markdown"):
+            _generate_markdown([i for i in icons if str(i.file_path) in records], dist_path)
+    # Keep an existing gallery in step with the atlas it draws from
+    gallery = gallery or (dist_path / GALLERY_DIR).exists()
+    if changed or not (dist_path / f"{ATLAS_NAME}.json").exists() or (gallery and not (dist_path / GALLERY_DIR).exists()):
+        with profiler.stage("atlas"):
+            atlas = write_atlas(records.values(), dist_path)
+            if gallery:
+                write_gallery(atlas, dist_path)
+    manifest_stale = binary_manifest != (dist_path / BINARY_MANIFEST_NAME).exists()
+    if changed or manifest_stale or not (dist_path / MANIFEST_NAME).exists():
+        with profiler.stage("manifest"):
+            write_manifest(records.values(), category_files, dist_path, binary=binary_manifest)
+
+    with profiler.stage("publish"):
+        result = publish.publish(dist_path, published, keep=keep_generations)
+    if result:
+        generation, written, shared = result
+        kept = f"; previous build kept as {generation.name}" if generation else ""
+        print(f"Published {published}/: {written} files written, {shared} shared{kept}.")
+    # Only once dist/ holds these outputs may the state say so
+    cache.save_state(new_state)
+    print(f"Build cache: {cache.hits} hits, {cache.misses} misses, {len(changed)} categories rebuilt.")
+    if optimise_sprites:
+        _print_sprite_savings(records.values())
+    duplicates = duplicate_clusters(records.values())
+    if duplicates:
+        print(f"{sum(len(d['icons']) for d in duplicates)} icons share {len(duplicates)} images "
+              "(listed under `duplicates` in the manifest).")
+    if failures:
+        print(f"{len(failures)} icon(s) failed:")
+        for f in sorted(failures, key=lambda f: f["source"]):
+            print(f"  {f['source']} ({f['target']}), {f['stage']}: {f['error']}")
+    return failures
+
+
+def rollback(generation=None):
+    """
+    Swap an earlier generation (by default the newest kept one) back in as
+    dist/. The build state described the newer outputs, so it's
+    dropped and the next build checks every icon against the cache again.
+    """
+    target = publish.rollback(Path("dist"), generation)
+    BuildCache().state_file.unlink(missing_ok=True)
+    return target
+
+def _print_sprite_savings(records):
+    """Bytes the sprite optimiser saved against plain 16z, per category."""
+    saved = {}
+    for record in records:
+        info = record["sprite"].get("optimised")
+        if info:
+            before, after = saved.get(record["category"], (0, 0))
+            saved[record["category"]] = (before + info["baseline_bytes"], after + info["bytes"])
+    if not saved:
+        return
+    total_before = sum(before for before, _ in saved.values())
+    total_after = sum(after for _, after in saved.values())
+    print("Sprite bytes saved per category:")
+    for category, (before, after) in sorted(saved.items(), key=lambda item: item[1][1] - item[1][0]):
+        if before != after:
+            print(f"  {category:<40} {before - after:>8} ({(before - after) / before:.0%})")
+    print(f"  {'total':<40} {total_before - total_after:>8} ({(total_before - total_after) / total_before:.0%})")
 
 def _load_config():
     try:
-        with open("scripts/config.yml") as f:
-            return yaml.safe_load(f)
+        return config_module.load()
     except Exception as e:
         print(f"Error loading config.yml: {e}")
         sys.exit(1)
 
+def _check_jar_encoder():
+    try:
+        check_jar_encoder()
+    except EncoderError as e:
+        print(f"Error: {e}. Run check-env for details, or build with --encoder native.")
+        sys.exit(1)
+
 def _collect_icons(config):
     files = list(Path("source", "official").glob("**/*.png"))
     return [Icon(str(f), config) for f in files]
 
-def _process_icon(icon):
-    icon_dir = Path("dist") / icon.category
-    icon_dir.mkdir(parents=True, exist_ok=True)  # Ensure directory is created correctly
-    icon.generate_image(icon_dir, color=True, max_target_size=128, transparency=False)
-    icon.generate_puml(icon_dir)
-    icon.generate_image(icon_dir, color=True, max_target_size=128, transparency=True)
+def image_variants(config):
+    """
+    (filename suffix, max size, transparency) for every PNG written per icon:
+    the transparent icon at TargetMaxSize, the opaque copy the sprite is
+    encoded from, and a transparent copy for each smaller TargetSizes entry.
+    """
+    max_size = config.target_max_size
+    variants = [("", max_size, True), (SPRITE_SOURCE_SUFFIX, max_size, False)]
+    for size in sorted(set(config.target_sizes)):
+        if size < max_size:
+            variants.append((f"_{size}", size, True))
+    return variants
+
+def render_params(variants, encoder, optimise):
+    """Everything besides the icon itself that goes into its build cache key."""
+    return {"variants": variants, "sprite": SPRITE_LEVEL, "encoder": resolve_backend(encoder), "optimise": optimise}
+
+def icon_outputs(icon, dist_path, variants):
+    icon_dir = dist_path / icon.category
+    images = [icon_dir / f"{icon.target}{suffix}.png" for suffix, _, _ in variants]
+    return images + [icon_dir / f"{icon.target}.puml"]
+
+def resize_icon(icon, variants):
+    """Pipeline stage: the icon's PNG variants as bytes, keyed by suffix."""
+    timings = []
+    with timed(timings, icon.target, "resize"):
+        images = icon.render_images(variants)
+    return icon, images, timings
+
+def encode_icon(resized, variants, encoder="auto", use_cache=True, optimise=False):
+    """
+    Pipeline stage: encode the sprite from the opaque variant's bytes into the
+    icon's .puml text. Returns (icon, files, puml text, timings), where `files`
+    maps each output's dist-relative path to its bytes. The in-memory library
+    (library.py) builds from the same two stages.
+    """
+    icon, images, timings = resized
+    sprite_cache = SpriteCache() if use_cache else None
+    with timed(timings, icon.target, "encode"):
+        content = icon.puml(images[SPRITE_SOURCE_SUFFIX], encoder=encoder, sprite_cache=sprite_cache,
+                            optimise=optimise)
+    files = {f"{icon.category}/{icon.target}{suffix}.png": images[suffix] for suffix, _, _ in variants}
+    files[f"{icon.category}/{icon.target}.puml"] = content.encode("utf-8")
+    return icon, files, content, timings
+
+def _write_icon(encoded, dist_path=Path("dist")):
+    """Pipeline stage: write the icon's files and return its manifest record with the step timings."""
+    icon, files, content, timings = encoded
+    with timed(timings, icon.target, "write"):
+        (dist_path / icon.category).mkdir(parents=True, exist_ok=True)
+        for rel, data in files.items():
+            write_file(dist_path / rel, data)
+    return icon_record(icon, files, content), timings
+
+def render_icon(icon, variants, encoder="auto", use_cache=True, optimise=False, dist_path=Path("dist")):
+    """Resize, encode and write one icon in this process and return its manifest record."""
+    encoded = encode_icon(resize_icon(icon, variants), variants, encoder, use_cache, optimise)
+    record, _ = _write_icon(encoded, dist_path)
+    return record
+
+def _encode_jobs(jobs, encoder):
+    # Each jar worker keeps its own JVM around, so run fewer of them
+    if resolve_backend(encoder) == "jar":
+        return max(1, jobs // 2)
+    return jobs
 
-def _create_category_all_file(category_path):
+def icon_record(icon, files, puml_content):
+    """The manifest record for an icon whose outputs are `files`, dist-relative paths to bytes."""
+    m = SPRITE_HEADER_RE.search(puml_content)
+    return {
+        "source": str(icon.file_path),
+        "category": icon.category,
+        "target": icon.target,
+        "color": icon.color,
+        "puml": f"{icon.category}/{icon.target}.puml",
+        "png": f"{icon.category}/{icon.target}.png",
+        "files": list(files),
+        "sprite": {
+            "name": m.group(1),
+            "width": int(m.group(2)),
+            "height": int(m.group(3)),
+            "level": m.group(4),
+            "pixels": icon.pixel_hash,
+            **({"optimised": icon.sprite_info} if icon.sprite_info else {}),
+        },
+        "sha256": {rel: hashlib.sha256(data).hexdigest() for rel, data in files.items()},
+    }
+
+def _load_previous_manifest(dist_path):
+    try:
+        manifest = load_manifest(dist_path)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"categories": {}, "icons": []}
+    return manifest
+
+def create_category_all_file(category_path, records):
+    """Write the category's all.puml (see `category_all_content`) and return its sha256."""
+    encoded = category_all_content(records, lambda rel: (category_path.parent / rel).read_text(encoding="utf-8"))
+    write_file(category_path / "all.puml", encoded)
+    return hashlib.sha256(encoded).hexdigest()
+
+def category_all_content(records, read):
+    """
+    Concatenate the category's icon files into all.puml's bytes, recording
+    each sprite's byte offset and length in its record. Every icon keeps its
+    own sprite, duplicate images included, since diagrams may draw any of
+    them directly as <$name>. `read` returns the text of a dist-relative path.
+    """
     data = ""
-    for f in sorted(category_path.glob("*.puml")):
-        with open(f, "r") as rf:
-            data += rf.read() + "\n"
+    for record in sorted(records, key=lambda r: r["puml"]):
+        data += read(record["puml"]) + "\n"
 
     # Remove individual comments and add a single header
     filtered_lines = []
@@ -88,22 +378,37 @@ def _create_category_all_file(category_path):
             filtered_lines.append(line)
     content = PUML_COPYRIGHT + "\n".join(filtered_lines) + "\n"
 
-    with open(category_path / "all.puml", "w") as af:
-        af.write(content)
+    encoded = content.encode("utf-8")
+    for record in records:
+        name = record["sprite"]["name"]
+        start = encoded.find(f"sprite ${name} ".encode("utf-8"))
+        line_end = encoded.find(b"\n", start)
+        end = encoded.find(b"\n}", start) + 2 if encoded[line_end - 1:line_end] == b"{" else line_end
+        record["sprite"].update({"offset": start, "length": end - start})
+    return encoded
 
 def _generate_markdown(icons, dist_path):
-    icons_sorted = sorted(icons, key=lambda x: (x.category, x.target))
-    categories = sorted({icon.category for icon in icons})
-    md = MARKDOWN_PREFIX_TEMPLATE
-
-    for cat in categories:
-        md += f"**{cat}**||||\n"  # Just an extra line for grouping
-        md += f"{cat}|(all macros)| - | [all.puml](dist/{cat}/all.puml) |\n"
-        for icon in icons_sorted:
-            if icon.category == cat:
-                png_rel = f"dist/{cat}/{icon.target}.png"
-                puml_rel = f"dist/{cat}/{icon.target}.puml"
-                md_line = f"{cat}|{icon.target}|![{icon.target}]({png_rel})|{puml_rel}|"
-                md += md_line + "\n"
-
-    (dist_path / "GCPSymbols.md").write_text(md, encoding="utf-8")
\ No newline at end of file
+    # One pass over the sorted icons, starting a new group when the category changes
+    blocks = {}
+    for cat, group in groupby(sorted(icons, key=lambda x: (x.category, x.target)), key=lambda x: x.category):
+        blocks[cat] = markdown_rows(cat, group)
+    write_markdown(blocks, dist_path)
+
+def markdown_rows(cat, icons):
+    """The GCPSymbols.md rows for one category's icons, in target order."""
+    lines = [
+        f"**{cat}**||||",  # Just an extra line for grouping
+        f"{cat}|(all macros)| - | [all.puml](dist/{cat}/all.puml) |",
+    ]
+    for icon in sorted(icons, key=lambda x: x.target):
+        png_rel = f"dist/{cat}/{icon.target}.png"
+        puml_rel = f"dist/{cat}/{icon.target}.puml"
+        lines.append(f"{cat}|{icon.target}|![{icon.target}]({png_rel})|{puml_rel}|")
+    return lines
+
+def write_markdown(blocks, dist_path):
+    write_file(dist_path / "GCPSymbols.md", markdown_text(blocks).encode("utf-8"))
+
+def markdown_text(blocks):
+    """GCPSymbols.md from each category's rows."""
+    return MARKDOWN_PREFIX_TEMPLATE + "".join(line + "\n" for cat in sorted(blocks) for line in blocks[cat])
@@ -0,0 +1,84 @@
+import re
+from pathlib import Path
+
+from .icon import PUML_LICENSE_HEADER, alias_puml
+from .manifest import load_manifest, macro_index
+
+DEFAULT_COMMON = "GCPCommon.puml"
+
+# `foo(` and `fooParticipant(` calls, plus `<$foo>` sprite references
+MACRO_CALL_RE = re.compile(r"\b(\w+)\s*\(")
+SPRITE_REF_RE = re.compile(r"<\$(\w+)")
+COMMON_INCLUDE_RE = re.compile(r"^\s*!include(?:url)?\s+\S*?(GCP\w+\.puml)\s*$")
+
+def bundle(diagram_files, output_file, dist_path=Path("dist")):
+    """
+    Write a single include holding the shared GCP macros plus only the
+    sprites and defines that `diagram_files` use, each distinct image once.
+    Returns the sorted list of bundled macro names.
+    """
+    dist_path = Path(dist_path)
+    index = macro_index(load_manifest(dist_path, fallback=True))
+
+    used = set()
+    sprite_refs = set()
+    commons = []
+    for diagram_file in diagram_files:
+        text = Path(diagram_file).read_text(encoding="utf-8")
+        macros, sprites, includes = _scan(text, index)
+        used |= macros
+        sprite_refs |= sprites
+        commons += [c for c in includes if c not in commons]
+    content = bundle_content(used, commons, index, lambda rel: (dist_path / rel).read_text(encoding="utf-8"),
+                             sprite_refs=sprite_refs)
+
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    Path(output_file).write_text(content, encoding="utf-8")
+    return sorted(used)
+
+def bundle_content(macros, commons, index, read, sprite_refs=None):
+    """
+    The bundled include text for `macros`, after the shared `commons` files.
+    `read` returns the text of a dist-relative path. Icons drawn from
+    identical pixels share the first one's sprite, except those in
+    `sprite_refs`, the names the diagrams draw directly as <$name>, which
+    keep their own. With `sprite_refs` None, any of them might be, so none
+    are shared.
+    """
+    commons = commons or [DEFAULT_COMMON]
+    content = ""
+    for common in commons:
+        content += read(common).rstrip("\n") + "\n\n"
+    content += PUML_LICENSE_HEADER
+    canonical = {}
+    for macro in sorted(macros):
+        icon_text = read(index[macro]["puml"])
+        first = canonical.setdefault(index[macro]["sprite"].get("pixels") or macro, macro)
+        if first != macro and sprite_refs is not None and macro not in sprite_refs:
+            icon_text = alias_puml(icon_text, macro, first)
+        content += "\n".join(line for line in icon_text.splitlines() if not line.startswith("'"))
+        content += "\n"
+    return content
+
+def _scan(text, index):
+    """Return (macros used, sprites drawn as <$name>, shared GCP*.puml files included) for one diagram."""
+    macros = set()
+    sprites = set()
+    commons = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("'"):
+            continue
+        m = COMMON_INCLUDE_RE.match(line)
+        if m:
+            commons.append(m.group(1))
+            continue
+        if stripped.startswith("!"):
+            continue
+        sprites |= {name for name in SPRITE_REF_RE.findall(line) if name in index}
+        for name in MACRO_CALL_RE.findall(line) + SPRITE_REF_RE.findall(line):
+            if name in index:
+                macros.add(name)
+            elif name.endswith("Participant") and name[:-len("Participant")] in index:
+                macros.add(name[:-len("Participant")])
+    return macros, sprites, commons
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from .publish import write_file
+
+CACHE_DIR = Path(".cache") / "build"
+
+# Bump when the image or puml pipeline changes in a way that alters outputs
+CACHE_VERSION = 3
+
+class BuildCache:
+    """
+    Content-addressed store of per-icon build outputs.
+
+    Each entry is keyed by a hash of the source PNG bytes, the resolved config
+    entry and the render parameters, and holds copies of the files the icon
+    produced. `state.json` records which key each icon's outputs in dist/ came
+    from, so unchanged icons need neither re-rendering nor copying.
+    """
+    def __init__(self, root=CACHE_DIR):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.state_file = self.root / "state.json"
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, icon, params):
+        h = hashlib.sha256()
+        h.update(icon.file_path.read_bytes())
+        entry = {"category": icon.category, "target": icon.target, "color": icon.color, "sprite": icon.sprite_options}
+        h.update(json.dumps(entry, sort_keys=True).encode("utf-8"))
+        h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        h.update(str(CACHE_VERSION).encode("utf-8"))
+        return h.hexdigest()
+
+    def lookup(self, key):
+        entry_dir = self._entry_dir(key)
+        return entry_dir if (entry_dir / ".complete").exists() else None
+
+    def restore(self, key, out_dir):
+        """Copy an entry's files into `out_dir` and return its metadata."""
+        entry_dir = self.lookup(key)
+        for f in entry_dir.iterdir():
+            if f.name not in (".complete", ".meta.json"):
+                write_file(out_dir / f.name, f.read_bytes())
+        return self.meta(key)
+
+    def meta(self, key):
+        return json.loads((self._entry_dir(key) / ".meta.json").read_text(encoding="utf-8"))
+
+    def store(self, key, files, meta):
+        entry_dir = self._entry_dir(key)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        for f in files:
+            shutil.copy2(f, entry_dir / f.name)
+        (entry_dir / ".meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        (entry_dir / ".complete").touch()
+
+    def load_state(self):
+        try:
+            return json.loads(self.state_file.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_state(self, state):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.state_file)
+
+    def _entry_dir(self, key):
+        return self.objects / key[:2] / key
+
+class SpriteCache:
+    """
+    Encoded sprites keyed by a hash of the pixels they were encoded from, so
+    icons that resize to the same image are encoded once, whichever worker,
+    category or build meets them first.
+    """
+    def __init__(self, root=CACHE_DIR / "sprites"):
+        self.root = Path(root)
+
+    def get(self, pixel_hash, params, name):
+        """(the cached sprite renamed to `name`, its metadata), or None."""
+        try:
+            entry = json.loads(self._path(pixel_hash, params).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry["sprite"].replace(f"sprite ${entry['name']} ", f"sprite ${name} ", 1), entry.get("meta")
+
+    def put(self, pixel_hash, params, name, sprite, meta=None):
+        path = self._path(pixel_hash, params)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"name": name, "sprite": sprite, "meta": meta}), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _path(self, pixel_hash, params):
+        key = hashlib.sha256(f"{pixel_hash}\0{params}".encode("utf-8")).hexdigest()
+        return self.root / key[:2] / f"{key}.json"
+
+def pixel_hash(image):
+    """Hash of an image's size and RGB pixels, as the sprite encoder sees them."""
+    h = hashlib.sha256(f"{image.width}x{image.height}".encode("utf-8"))
+    h.update(image.convert("RGB").tobytes())
+    return h.hexdigest()
@@ -1,7 +1,8 @@
 import click
 from pathlib import Path
 
-from . import env, builder, configgen, fetcher
+# Command modules are imported inside each command, so `--help` and light
+# commands don't pay for Pillow, NumPy, PyYAML or requests
 
 @click.group()
 def cli():
@@ -11,25 +12,251 @@ def cli():
 @cli.command()
 def check_env():
     """Check environment prerequisites."""
+    from . import env
     env.verify()
 
 @cli.command()
 def create_config_template():
     """Create a config-template.yml based on current icons."""
+    from . import configgen
     configgen.create()
 
 @cli.command()
-def build():
+@click.option("--encoder", type=click.Choice(["auto", "native", "jar"]), default="auto",
+              help="Sprite encoder: plantuml.jar, native NumPy, or auto (the jar when java is available, else native).")
+@click.option("--clean", is_flag=True, help="Wipe dist/ and the build state before building.")
+@click.option("--no-cache", is_flag=True, help="Re-render every icon instead of reusing cached outputs.")
+@click.option("--binary-manifest", is_flag=True, help="Also write dist/manifest.bin, a compressed copy of the manifest.")
+@click.option("--profile", is_flag=True, help="Time each build stage and icon, and print a summary.")
+@click.option("--profile-dir", default="profile", help="Where --profile writes profile.json and profile.csv.")
+@click.option("--chrome-trace", is_flag=True, help="With --profile, also write trace.json for chrome://tracing.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=None,
+              help="Worker processes per pipeline stage (default: CPU count).")
+@click.option("--gallery", is_flag=True, help="Also write a paginated HTML gallery to dist/gallery/.")
+@click.option("--optimise-sprites", is_flag=True,
+              help="Encode each sprite as the smallest level/size within the configured Sprite.MaxError.")
+@click.option("--keep-generations", default=3, show_default=True, type=click.IntRange(min=1),
+              help="Published dist/ generations to keep for rollback.")
+@click.option("--watch", is_flag=True, help="After building, keep rebuilding what changes in source/ and config.yml.")
+@click.option("--debounce", default=0.25, show_default=True, help="With --watch, seconds of quiet before rebuilding.")
+def build(encoder, clean, no_cache, binary_manifest, profile, profile_dir, chrome_trace, jobs, gallery,
+          optimise_sprites, keep_generations, watch, debounce):
     """Build icons and generate PlantUML files."""
-    builder.build_all()
+    from . import builder
+    from .profiling import Profiler
+    profiler = Profiler(enabled=profile)
+    failures = builder.build_all(encoder, clean=clean, use_cache=not no_cache, binary_manifest=binary_manifest,
+                                 profiler=profiler, jobs=jobs, gallery=gallery,
+                                 optimise_sprites=optimise_sprites, keep_generations=keep_generations)
+    if profile:
+        profiler.write(profile_dir, chrome_trace=chrome_trace)
+        print(profiler.summary())
+        print(f"Profile written to {profile_dir}/")
+    if watch:
+        from .watch import watch as watch_sources
+        try:
+            watch_sources(encoder, use_cache=not no_cache, optimise_sprites=optimise_sprites,
+                          binary_manifest=binary_manifest, keep_generations=keep_generations,
+                          debounce=debounce)
+        except KeyboardInterrupt:
+            pass
+    elif failures:
+        raise SystemExit(1)
 
 @cli.command()
-def fetch_icons():
+@click.argument("generation", required=False)
+@click.option("--list", "list_only", is_flag=True, help="List the kept generations instead of rolling back.")
+def rollback(generation, list_only):
+    """
+    Swap an earlier build (GENERATION, default: the newest kept one) back in as dist/.
+    """
+    from . import builder, publish
+    if list_only:
+        for path in reversed(publish.generations(Path("dist"))):
+            print(f"{path.name}  {path}")
+        return
+    try:
+        restored, replaced = builder.rollback(generation)
+    except ValueError as e:
+        print(e)
+        raise SystemExit(1)
+    print(f"dist/ now holds {restored}; the build it replaced is kept as {replaced.name}.")
+
+@cli.command()
+@click.argument("previous", type=click.Path(exists=True, file_okay=False))
+@click.argument("current", type=click.Path(exists=True, file_okay=False), default="dist")
+@click.option("--threshold", default=0.01, show_default=True, help="Mean absolute pixel difference (0-1) to report.")
+@click.option("--hash-distance", default=4, show_default=True, help="Perceptual-hash bits that may differ before reporting.")
+@click.option("--sprites", is_flag=True, help="Compare the decoded sprites in the .puml files instead of the PNGs.")
+@click.option("--sheet", type=click.Path(dir_okay=False), help="Write a contact sheet of the changed icons to this PNG.")
+def verify_visual(previous, current, threshold, hash_distance, sprites, sheet):
+    """
+    Report icons in CURRENT (default dist/) that look different from PREVIOUS.
+    """
+    from .visual import verify_visual as compare_dirs
+    compared, changes = compare_dirs(Path(previous), Path(current), threshold, hash_distance, sprites, sheet)
+    print(f"Compared {compared} icons: {len(changes)} changed.")
+    for c in changes:
+        if c["pixel"] is None:
+            print(f"  {c['name']}: {c['note']}")
+        else:
+            print(f"  {c['name']}: pixel {c['pixel']:.2%}, hash distance {c['hash']} {c['note']}".rstrip())
+    if sheet and changes:
+        print(f"Contact sheet written to {sheet}")
+    if changes:
+        raise SystemExit(1)
+
+@cli.command()
+@click.argument("diagrams", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--output", default="bundle.puml", help="Path of the bundled include file to write.")
+@click.option("--dist-dir", default="dist", help="Built library to resolve macros against.")
+def bundle(diagrams, output, dist_dir):
+    """
+    Write a single include with only the sprites and macros DIAGRAMS use.
+    """
+    from .bundler import bundle as bundle_diagrams
+    try:
+        macros = bundle_diagrams(diagrams, output, Path(dist_dir))
+    except FileNotFoundError as e:
+        print(e)
+        raise SystemExit(1)
+    print(f"Bundled {len(macros)} macros into {output}.")
+
+@cli.command()
+@click.option("--dist-dir", default="dist", show_default=True, help="Built library to serve.")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8765, show_default=True)
+def serve(dist_dir, host, port):
+    """
+    Serve dist/ over HTTP with ETags and gzip, plus /bundle?macros=A,B bundles.
+    """
+    import asyncio
+    from . import serve as server
+    if not (Path(dist_dir) / "manifest.json").exists():
+        print(f"No manifest.json in {dist_dir}. Run the build command first.")
+        raise SystemExit(1)
+
+    def ready(address):
+        print(f"Serving {dist_dir} on http://{address[0]}:{address[1]}/ (Ctrl+C to stop)")
+
+    try:
+        asyncio.run(server.serve(dist_dir, host, port, ready=ready))
+    except KeyboardInterrupt:
+        pass
+
+@cli.command()
+@click.option("--url", help="Server to test, e.g. http://127.0.0.1:8765 (default: start one on dist/).")
+@click.option("--dist-dir", default="dist", show_default=True, help="Library to serve and pick paths from.")
+@click.option("--path", "paths", multiple=True, help="Path to request (repeatable; default: a mix of includes and a bundle).")
+@click.option("--requests", "count", default=2000, show_default=True, help="Total requests to send.")
+@click.option("--concurrency", default=20, show_default=True, help="Concurrent keep-alive connections.")
+@click.option("--revalidate", is_flag=True, help="Send If-None-Match with the last ETag seen, like a caching client.")
+@click.option("--no-gzip", is_flag=True, help="Don't send Accept-Encoding: gzip.")
+def load_test(url, dist_dir, paths, count, concurrency, revalidate, no_gzip):
+    """
+    Load test the include server and report throughput and latency.
+    """
+    import asyncio
+    from urllib.parse import urlsplit
+    from . import serve as server
+    options = {"requests": count, "concurrency": concurrency, "revalidate": revalidate, "gzip_ok": not no_gzip}
+    if url:
+        target = urlsplit(url)
+        paths = list(paths) or server.default_paths(dist_dir)
+        results = asyncio.run(server.load_test(target.hostname, target.port or 80, paths, **options))
+    else:
+        results = asyncio.run(server.load_test_local(dist_dir, list(paths) or None, **options))
+
+    statuses = ", ".join(f"{status}: {n}" for status, n in results["statuses"].items())
+    print(f"{sum(results['statuses'].values())} responses ({statuses}), {results['errors']} errors, "
+          f"{results['bytes'] / 1024:.0f} KiB in {results['elapsed']:.2f}s")
+    print(f"{results['rps']:.0f} req/s, latency p50 {results['p50'] * 1000:.2f}ms, "
+          f"p95 {results['p95'] * 1000:.2f}ms, p99 {results['p99'] * 1000:.2f}ms")
+    if results["errors"] or any(status >= 400 for status in results["statuses"]):
+        raise SystemExit(1)
+
+@cli.command()
+@click.option("--url", help="Where to download the icon archive from (default: Google Cloud's icon zip).")
+@click.option("--zip", "zip_file", type=click.Path(exists=True, dir_okay=False),
+              help="Sync from a local copy of the archive instead of downloading it.")
+@click.option("--clean", is_flag=True, help="Replace source/official wholesale instead of syncing changed files.")
+@click.option("--offline", is_flag=True, help="Use the cached archive without contacting the server.")
+@click.option("--chunk-size", type=int, help="Download chunk size in bytes (default: 1 MiB).")
+def fetch_icons(url, zip_file, clean, offline, chunk_size):
     """
     Download the GCP basic-cards zip,
     unzip, normalize, and copy into source/official.
     """
-    fetcher.fetch_and_prepare_icons()
+    from . import fetcher
+    url = url or fetcher.ICON_ZIP_URL
+    chunk_size = chunk_size or fetcher.DEFAULT_CHUNK_SIZE
+    if clean:
+        fetcher.fetch_and_prepare_icons(url, zip_file, chunk_size=chunk_size, offline=offline)
+    else:
+        fetcher.sync_icons(url, zip_file, chunk_size=chunk_size, offline=offline)
+
+@cli.command()
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--format", "fmt", type=click.Choice(["png", "svg"]), default="png", show_default=True)
+@click.option("--output-dir", help="Write images here instead of next to each diagram.")
+@click.option("--threads", type=click.IntRange(min=1), default=None, help="PlantUML -nbthread (default: CPU count).")
+@click.option("--no-cache", is_flag=True, help="Re-render diagrams even when their cached image is current.")
+def render(paths, fmt, output_dir, threads, no_cache):
+    """
+    Render .puml files or directories of them with a single PlantUML run.
+    """
+    import shutil
+    from .encoder import PLANTUML_JAR
+    from .render import render as render_diagrams
+    if not PLANTUML_JAR.is_file() or shutil.which("java") is None:
+        print("Error: rendering needs java and scripts/plantuml.jar.")
+        raise SystemExit(1)
+    rendered, cached, failed = render_diagrams(paths, output_dir, fmt=fmt, threads=threads, use_cache=not no_cache)
+    print(f"Rendered {len(rendered)} diagrams, {len(cached)} from cache, {len(failed)} failed.")
+    if failed:
+        print("Failed: " + ", ".join(str(f) for f in failed))
+        raise SystemExit(1)
+
+@cli.command()
+@click.option("--output", default="benchmark/results.json", help="Where to write the results JSON.")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False),
+              help="Results JSON to compare against; exits 1 on regressions.")
+@click.option("--tolerance", default=0.10, show_default=True, help="Allowed slowdown before a metric counts as a regression.")
+@click.option("--repeat", default=1, show_default=True, help="Runs per measurement; the fastest is kept.")
+@click.option("--grid-size", "grid_sizes", multiple=True, type=int, help="Kitchen-sink grid sizes to render (repeatable).")
+@click.option("--num-nodes", "node_counts", multiple=True, type=int, help="Complex diagram node counts to render (repeatable).")
+@click.option("--no-render", is_flag=True, help="Skip PlantUML rendering, only time the build.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=None, help="Build worker processes per stage.")
+def benchmark(output, baseline, tolerance, repeat, grid_sizes, node_counts, no_render, jobs):
+    """
+    Time the build, per-icon costs, diagram rendering and include strategies.
+    """
+    from . import benchmark as bench
+    results = bench.run_suite(
+        grid_sizes=grid_sizes or bench.DEFAULT_GRID_SIZES,
+        node_counts=node_counts or bench.DEFAULT_NODE_COUNTS,
+        repeat=repeat,
+        render=not no_render,
+        jobs=jobs,
+    )
+    bench.write_results(results, output)
+    if not results["environment"]["render"]:
+        print("Rendering skipped (needs java and scripts/plantuml.jar).")
+
+    rows = [(name, None, m["value"], None) for name, m in sorted(results["metrics"].items())]
+    regressions = []
+    if baseline:
+        rows, regressions = bench.compare(results, bench.load_results(baseline), tolerance)
+    print(f"{'Metric':<36} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, base, current, change in rows:
+        base_col = f"{base:>12.4f}" if base is not None else f"{'':>12}"
+        change_col = f"{change:>+8.1%}" if change is not None else ""
+        print(f"{name:<36} {base_col} {current:>12.4f} {change_col}")
+    print(f"Results written to {output}")
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {tolerance:.0%}: "
+              + ", ".join(name for name, *_ in regressions))
+        raise SystemExit(1)
 
 @cli.command()
 @click.option("--grid-size", default=5, help="Size of the N x N grid (default is 5).")
@@ -39,7 +266,11 @@ def generate_kitchen_sink(grid_size, output_dir):
     Generate a kitchen-sync example with an NxN grid of icons.
     """
     from .kitchen_sink import generate_kitchen_sync_example
-    generate_kitchen_sync_example(grid_size, output_dir)
+    try:
+        generate_kitchen_sync_example(grid_size, output_dir)
+    except FileNotFoundError as e:
+        print(e)
+        raise SystemExit(1)
 
 @cli.command()
 @click.option("--output-dir", default="benchmark/verification", help="Directory to save the verification .puml files.")
@@ -48,15 +279,28 @@ def generate_verification_examples(output_dir):
     Generate verification .puml files for each individual icon.
     """
     from .kitchen_sink import generate_verification_examples
-    generate_verification_examples(output_dir)
+    try:
+        generate_verification_examples(output_dir)
+    except FileNotFoundError as e:
+        print(e)
+        raise SystemExit(1)
 
 @cli.command()
 @click.option("--output-dir", default="benchmark", help="Directory to save the benchmark .puml file.")
 @click.option("--num-nodes", default=100, help="Number of nodes in the diagram (default: 100).")
 @click.option("--max-connections", default=5, help="Maximum connections per node (default: 5).")
-def generate_complex_diagram(output_dir, num_nodes, max_connections):
+@click.option("--topology", type=click.Choice(["random", "layered", "scale-free", "clustered"]), default="random",
+              show_default=True, help="How nodes are connected.")
+@click.option("--seed", type=int, default=None, help="Random seed, for reproducible diagrams.")
+@click.option("--cluster-size", default=20, show_default=True, help="Nodes per cluster for the clustered topology.")
+def generate_complex_diagram(output_dir, num_nodes, max_connections, topology, seed, cluster_size):
     """
     Generate a complex network diagram with interconnected icons.
     """
     from .kitchen_sink import generate_complex_diagram
-    generate_complex_diagram(output_dir, max_connections, num_nodes)
\ No newline at end of file
+    try:
+        generate_complex_diagram(output_dir, max_connections, num_nodes, topology=topology, seed=seed,
+                                 cluster_size=cluster_size)
+    except FileNotFoundError as e:
+        print(e)
+        raise SystemExit(1)
\ No newline at end of file
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import pickle
+from pathlib import Path
+
+CONFIG_PATH = Path("scripts") / "config.yml"
+CONFIG_CACHE = Path(".cache") / "config.pickle"
+
+# Bump when CompiledConfig changes shape so stale pickles are ignored
+COMPILED_VERSION = 3
+
+class CompiledConfig:
+    """
+    Flat lookup compiled from config.yml.
+    Maps (SourceDir, Source) to (category, target, color) with colours already
+    resolved, so icons don't scan the YAML tree and workers don't receive it.
+    """
+    def __init__(self, index, default_color="#000000", target_max_size=128, target_sizes=(),
+                 sprite_defaults=None, sprite_overrides=None):
+        self.index = index
+        self.default_color = default_color
+        self.target_max_size = target_max_size
+        self.target_sizes = tuple(target_sizes)
+        self.sprite_defaults = sprite_defaults or {}
+        self.sprite_overrides = sprite_overrides or {}
+
+    def lookup(self, source_dir, source):
+        return self.index.get((source_dir, source))
+
+    def sprite_options(self, source_dir, source):
+        """Sprite optimiser settings: Defaults.Sprite, then the service's own Sprite entry."""
+        return {**self.sprite_defaults, **self.sprite_overrides.get((source_dir, source), {})}
+
+def compile_config(raw):
+    index = {}
+    sprite_overrides = {}
+    for cat_item in raw.get("Categories", []):
+        cat_name = cat_item.get("Name", "Uncategorized")
+        src_dir = cat_item.get("SourceDir", "")
+        for svc in cat_item.get("Services", []):
+            # First match wins, as with the old linear scan
+            index.setdefault(
+                (src_dir, svc["Source"]),
+                (cat_name, svc["Target"], _resolve_color(svc, cat_item, raw)),
+            )
+            if "Sprite" in svc:
+                sprite_overrides.setdefault((src_dir, svc["Source"]), svc["Sprite"])
+    defaults = raw.get("Defaults", {})
+    return CompiledConfig(
+        index,
+        default_color=defaults.get("Category", {}).get("Color", "#000000"),
+        target_max_size=defaults.get("TargetMaxSize", 128),
+        target_sizes=defaults.get("TargetSizes", []),
+        sprite_defaults=defaults.get("Sprite", {}),
+        sprite_overrides=sprite_overrides,
+    )
+
+def load(path=CONFIG_PATH, cache_path=CONFIG_CACHE):
+    """
+    Load the compiled config, skipping YAML parsing when config.yml is unchanged.
+    The cache is trusted when the mtime and size match; otherwise the content
+    hash decides, so a touched but identical file doesn't force a re-parse.
+    """
+    path = Path(path)
+    cache_path = Path(cache_path)
+    st = path.stat()
+    cached = _read_cache(cache_path)
+    if cached and (cached["mtime_ns"], cached["size"]) == (st.st_mtime_ns, st.st_size):
+        return cached["config"]
+
+    data = path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    if cached and cached["sha256"] == digest:
+        compiled = cached["config"]
+    else:
+        import yaml
+        compiled = compile_config(yaml.safe_load(data))
+
+    _write_cache(cache_path, {
+        "version": COMPILED_VERSION,
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+        "sha256": digest,
+        "config": compiled,
+    })
+    return compiled
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(cached, dict) or cached.get("version") != COMPILED_VERSION:
+        return None
+    return cached
+
+def _write_cache(cache_path, cached):
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        print(f"Warning: could not write config cache: {e}")
+
+def _resolve_color(service_entry, category_entry, config):
+    # Check service, category, or default
+    if "Color" in service_entry:
+        return _lookup_color(service_entry["Color"], config)
+    if "Color" in category_entry:
+        return _lookup_color(category_entry["Color"], config)
+    defaults = config.get("Defaults", {}).get("Category", {})
+    return defaults.get("Color", "#000000")
+
+def _lookup_color(color_key, config):
+    colors = config.get("Defaults", {}).get("Colors", {})
+    return colors.get(color_key, "#4284F3")
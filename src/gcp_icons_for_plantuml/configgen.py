@@ -10,6 +10,7 @@ Defaults:
   Category:
     Color: GoogleBlue
   TargetMaxSize: 64
+  TargetSizes: [32]
 """
 
 def create():
@@ -18,6 +19,7 @@ def create():
     current_category = None
     category_dict = {}
     seen_targets = set()
+    same_image = _duplicate_images()
 
     for file_str in sorted(str(f) for f in source_files):
         parts = file_str.split("/")
@@ -36,6 +38,8 @@ def create():
         service_entry = {"Source": source_name, "Target": target_name}
         if target_name in seen_targets:
             service_entry["ZComment"] = "******* Duplicate target name *******"
+        if file_str in same_image:
+            service_entry["ZSameImageAs"] = ", ".join(same_image[file_str])
         category_dict["Services"].append(service_entry)
         seen_targets.add(target_name)
 
@@ -50,6 +54,19 @@ def create():
     print("Successfully created config-template.yml.")
     sys.exit(0)
 
+def _duplicate_images():
+    """Map each source PNG to the targets of the other icons the last build found it identical to."""
+    from .manifest import load_manifest
+    try:
+        clusters = load_manifest(Path("dist")).get("duplicates", [])
+    except FileNotFoundError:
+        return {}
+    same = {}
+    for cluster in clusters:
+        for icon in cluster["icons"]:
+            same[icon["source"]] = [i["target"] for i in cluster["icons"] if i is not icon]
+    return same
+
 def _build_file_list():
     p = Path("source") / "official"
     return p.glob("**/*.png")
@@ -0,0 +1,207 @@
+import atexit
+import base64
+import io
+import shutil
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+PLANTUML_JAR = Path("scripts") / "plantuml.jar"
+BACKENDS = ("auto", "native", "jar")
+SERVER_SOURCE = Path(__file__).with_name("SpriteEncoderServer.java")
+
+READY_MARKER = "@@READY@@"
+END_MARKER = "@@END@@"
+ERROR_MARKER = "@@ERROR@@"
+
+class EncoderError(Exception):
+    pass
+
+class NativeEncoder:
+    """
+    Encode sprites in-process with NumPy and zlib (see sprite.py).
+    No JVM needed; sprites decode to the same grey levels as the jar's, but
+    the text isn't byte-identical, so "auto" only picks it without java.
+    """
+    def encode(self, png_file, name, level="16z"):
+        from PIL import Image
+        from . import sprite
+
+        with Image.open(png_file) as im:
+            return sprite.encode_image(im, name, level)
+
+    def encode_bytes(self, png_data, name, level="16z"):
+        return self.encode(io.BytesIO(png_data), name, level)
+
+    def close(self):
+        pass
+
+class JarEncoder:
+    """
+    Encode each sprite with its own `java -jar plantuml.jar -encodesprite` run.
+    Pays JVM startup per icon; "auto" falls back to it when the persistent
+    server can't start.
+    """
+    def __init__(self, jar=PLANTUML_JAR):
+        self.jar = Path(jar)
+
+    def encode(self, png_file, name, level="16z"):
+        png_file = Path(png_file)
+        if png_file.stem != name:
+            # PlantUML names the sprite after the file, so encode a copy named `name`
+            with tempfile.TemporaryDirectory() as tmp:
+                named = Path(tmp) / f"{name}.png"
+                shutil.copyfile(png_file, named)
+                return self.encode(named, name, level)
+        result = subprocess.run(
+            ["java", "-jar", str(self.jar), "-encodesprite", level, str(png_file)],
+            capture_output=True,
+            check=True,
+        )
+        return result.stdout.decode("UTF-8")
+
+    def encode_bytes(self, png_data, name, level="16z"):
+        # -encodesprite only reads files, so this fallback needs one named after the sprite
+        with tempfile.TemporaryDirectory() as tmp:
+            png_file = Path(tmp) / f"{name}.png"
+            png_file.write_bytes(png_data)
+            return self.encode(png_file, name, level)
+
+    def close(self):
+        pass
+
+class PersistentJarEncoder:
+    """
+    A single long-lived PlantUML JVM running SpriteEncoderServer.java.
+    Requests go over stdin, sprites come back on stdout, so JVM startup is
+    paid once per encoder rather than once per icon.
+    """
+    def __init__(self, jar=PLANTUML_JAR):
+        self.jar = Path(jar)
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # stderr goes to a file, not a pipe nobody drains, so a failed start can say why
+        with tempfile.TemporaryFile() as errors:
+            self._proc = subprocess.Popen(
+                ["java", "-cp", str(self.jar), str(SERVER_SOURCE)],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=errors,
+                text=True,
+                encoding="UTF-8",
+            )
+            ready = self._proc.stdout.readline()
+            if ready.rstrip("\n") != READY_MARKER:
+                self.close()
+                errors.seek(0)
+                lines = errors.read().decode("utf-8", "replace").strip().splitlines()
+                raise EncoderError("sprite encoder server failed to start" + (f": {lines[0]}" if lines else ""))
+        return self
+
+    def encode(self, png_file, name, level="16z"):
+        return self._request(level, name, str(png_file))
+
+    def encode_bytes(self, png_data, name, level="16z"):
+        """Encode PNG bytes sent over stdin, without touching the disk."""
+        return self._request(level, name, "base64:" + base64.b64encode(png_data).decode("ascii"))
+
+    def _request(self, level, name, image):
+        with self._lock:
+            if self._proc is None:
+                self.start()
+            try:
+                self._proc.stdin.write(f"{level}\t{name}\t{image}\n")
+                self._proc.stdin.flush()
+                lines = []
+                for line in self._proc.stdout:
+                    if line.rstrip("\n") == END_MARKER:
+                        break
+                    lines.append(line)
+                else:
+                    raise EncoderError("sprite encoder server exited unexpectedly")
+            except (BrokenPipeError, OSError) as e:
+                self.close()
+                raise EncoderError(f"sprite encoder server died: {e}") from e
+
+        output = "".join(lines)
+        if output.startswith(ERROR_MARKER):
+            raise EncoderError(output[len(ERROR_MARKER):].strip())
+        return output
+
+    def close(self):
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=5)
+        except Exception:
+            self._proc.kill()
+        self._proc = None
+
+def check_jar_encoder(jar=PLANTUML_JAR):
+    """
+    Start the persistent encoder on `jar` and encode a small test image with
+    it. Raises EncoderError saying what went wrong; returns the sprite.
+    """
+    from PIL import Image
+
+    if shutil.which("java") is None:
+        raise EncoderError("java not found on PATH")
+    if not Path(jar).is_file():
+        raise EncoderError(f"{jar} not found")
+    out = io.BytesIO()
+    Image.new("RGB", (4, 4), (66, 133, 244)).save(out, "PNG")
+    encoder = PersistentJarEncoder(jar)
+    try:
+        sprite = encoder.start().encode_bytes(out.getvalue(), "probe", "16z")
+    except OSError as e:
+        raise EncoderError(f"sprite encoder server failed to start: {e}") from e
+    finally:
+        encoder.close()
+    if not sprite.startswith("sprite $probe"):
+        raise EncoderError(f"unexpected sprite encoder output: {sprite[:80]!r}")
+    return sprite
+
+_encoders = {}
+
+def get_encoder(backend="auto"):
+    """
+    Return this process's sprite encoder for `backend`, starting it on first use.
+    "auto" uses plantuml.jar when java is on PATH and the native encoder
+    otherwise. Each build worker keeps one JVM alive for all the icons it handles.
+    "jar" raises EncoderError when that JVM can't be started.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend}")
+    if backend not in _encoders:
+        _encoders[backend] = _start_encoder(backend)
+        atexit.register(_encoders[backend].close)
+    return _encoders[backend]
+
+def resolve_backend(backend):
+    """Name the backend `get_encoder(backend)` would use, without starting it."""
+    if backend == "auto":
+        # The published sprites come from the jar. Native ones decode to the
+        # same pixels but aren't byte-identical, so they're only the fallback.
+        return "jar" if jar_available() else "native"
+    return backend
+
+def jar_available(jar=PLANTUML_JAR):
+    return Path(jar).is_file() and shutil.which("java") is not None
+
+def _start_encoder(backend):
+    if resolve_backend(backend) == "native":
+        import numpy  # noqa: F401
+        return NativeEncoder()
+    try:
+        return PersistentJarEncoder().start()
+    except (EncoderError, OSError) as e:
+        if backend == "jar":
+            # Asked for the jar explicitly: don't quietly pay a JVM per icon instead
+            raise EncoderError(f"persistent sprite encoder unavailable: {e}") from e
+        print(f"Warning: persistent sprite encoder unavailable ({e}); "
+              "starting one JVM per icon, which is much slower.")
+        return JarEncoder()
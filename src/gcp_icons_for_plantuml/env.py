@@ -1,7 +1,11 @@
+import json
+import shutil
 import subprocess
 import sys
 from pathlib import Path
 
+VERSION_CACHE = Path(".cache") / "plantuml-version.json"
+
 def verify():
     # Ensure config.yml exists
     config_path = Path("scripts/config.yml")
@@ -27,13 +31,74 @@ def verify():
         sys.exit(1)
 
     try:
-        subprocess.run(
-            ["java", "-jar", str(jar_path), "-version"],
-            capture_output=True,
-            check=True,
-        )
+        version = plantuml_version(jar_path)
     except Exception as e:
         print(f"Error running plantuml.jar: {e}")
         sys.exit(1)
 
-    print("Prerequisites met.")
\ No newline at end of file
+    print(version)
+
+    # The build encodes sprites through a long-lived JVM; make sure it works with this jar
+    from .encoder import EncoderError
+    try:
+        check_encoder(jar_path)
+    except EncoderError as e:
+        print(f"Error: the sprite encoder server doesn't work with {jar_path}: {e}")
+        sys.exit(1)
+    print("Sprite encoder server: OK")
+    print("Prerequisites met.")
+
+def plantuml_version(jar_path, cache_path=VERSION_CACHE):
+    """
+    First line of `java -jar plantuml.jar -version`. Starting a JVM for this
+    is slow, so the answer is cached until the jar or the java on PATH changes.
+    """
+    probes = _load_probes(jar_path, cache_path)
+    if "version" in probes:
+        return probes["version"]
+
+    result = subprocess.run(
+        ["java", "-jar", str(jar_path), "-version"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    probes["version"] = (result.stdout.strip().splitlines() or ["PlantUML (unknown version)"])[0]
+    _save_probes(probes, cache_path)
+    return probes["version"]
+
+def check_encoder(jar_path, cache_path=VERSION_CACHE):
+    """
+    Raise EncoderError unless the persistent sprite encoder works with
+    `jar_path`. A pass is cached alongside the version, and checked again
+    when the jar, the java on PATH or SpriteEncoderServer.java changes.
+    """
+    from .encoder import SERVER_SOURCE, check_jar_encoder
+
+    st = SERVER_SOURCE.stat()
+    server = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    probes = _load_probes(jar_path, cache_path)
+    if probes.get("encoder_server") == server:
+        return
+    check_jar_encoder(jar_path)
+    probes["encoder_server"] = server
+    _save_probes(probes, cache_path)
+
+def _load_probes(jar_path, cache_path):
+    """Cached probe results for `jar_path`, or none when the jar or java changed since."""
+    st = Path(jar_path).stat()
+    key = {"jar": str(jar_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "java": shutil.which("java")}
+    try:
+        cached = json.loads(Path(cache_path).read_text(encoding="utf-8"))
+        if cached.get("key") == key:
+            return cached
+    except (FileNotFoundError, ValueError):
+        pass
+    return {"key": key}
+
+def _save_probes(probes, cache_path):
+    try:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        Path(cache_path).write_text(json.dumps(probes), encoding="utf-8")
+    except OSError as e:
+        print(f"Warning: could not write version cache: {e}")
@@ -1,18 +1,122 @@
+import hashlib
+import json
 import os
 import re
 import shutil
 import tempfile
 import zipfile
-from pathlib import Path
-
-import requests
+import zlib
+from pathlib import Path, PurePosixPath
 
 ICON_ZIP_URL = "https://cloud.google.com/icons/files/google-cloud-icons.zip"
 OFFICIAL_DIR = Path("source") / "official"
+SYNC_REPORT = Path(".cache") / "sync-report.json"
+DOWNLOAD_CACHE = Path(".cache") / "downloads"
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+class SyncReport:
+    def __init__(self):
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.unchanged = 0
+
+    def to_dict(self):
+        return {
+            "added": self.added,
+            "changed": self.changed,
+            "removed": self.removed,
+            "unchanged": self.unchanged,
+        }
+
+    def summary(self):
+        return (f"{len(self.added)} added, {len(self.changed)} changed, "
+                f"{len(self.removed)} removed, {self.unchanged} unchanged")
+
+def sync_icons(url=ICON_ZIP_URL, zip_file=None, chunk_size=DEFAULT_CHUNK_SIZE, offline=False):
+    """
+    Bring source/official in line with the icon archive, touching only PNGs
+    that differ. Uses a local `zip_file` when given, otherwise the cached
+    download of `url`.
+    """
+    zip_path = Path(zip_file) if zip_file else download_zip(url, chunk_size=chunk_size, offline=offline)
+    report = sync_official(zip_path)
+
+    SYNC_REPORT.parent.mkdir(parents=True, exist_ok=True)
+    SYNC_REPORT.write_text(json.dumps(report.to_dict(), indent=1), encoding="utf-8")
+    print(f"Icon set synced into {OFFICIAL_DIR}: {report.summary()}.")
+    return report
+
+def sync_official(zip_path, official_dir=OFFICIAL_DIR):
+    """
+    Extract only the wanted PNG members of `zip_path` straight into
+    `official_dir`. A member is skipped when the existing file has the same
+    size and CRC32 as the central directory records; PNGs no longer in the
+    archive are deleted.
+    """
+    official_dir = Path(official_dir)
+    report = SyncReport()
+    wanted = set()
+
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        for info in zf.infolist():
+            rel_path = _member_path(info)
+            if rel_path is None:
+                continue
+            target = official_dir.joinpath(*rel_path.parts)
+            wanted.add(target)
+
+            if target.is_file():
+                if target.stat().st_size == info.file_size and _crc32(target) == info.CRC:
+                    report.unchanged += 1
+                    continue
+                report.changed.append(rel_path.as_posix())
+            else:
+                report.added.append(rel_path.as_posix())
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_name(target.name + ".part")
+            with zf.open(info) as src, open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(tmp, target)
+
+    if official_dir.exists():
+        for existing in sorted(official_dir.glob("**/*.png")):
+            if existing not in wanted:
+                existing.unlink()
+                report.removed.append(existing.relative_to(official_dir).as_posix())
+        _prune_empty_dirs(official_dir)
+    return report
+
+def _member_path(info):
+    """The member's path inside source/official, or None to skip it."""
+    if info.is_dir():
+        return None
+    path = PurePosixPath(info.filename)
+    if path.is_absolute() or ".." in path.parts:
+        return None
+    # Skip `__MACOSX` junk, Apple resource forks and anything but PNGs
+    if "__MACOSX" in path.parts or path.name.startswith("._"):
+        return None
+    if path.suffix.lower() != ".png":
+        return None
+    return path
+
+def _crc32(path):
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
 
-def fetch_and_prepare_icons():
-    # Download zip
-    zip_path = download_zip(ICON_ZIP_URL)
+def _prune_empty_dirs(root):
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if Path(dirpath) != root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+def fetch_and_prepare_icons(url=ICON_ZIP_URL, zip_file=None, chunk_size=DEFAULT_CHUNK_SIZE, offline=False):
+    # Use the local zip, or download it (or reuse the cached copy)
+    zip_path = Path(zip_file) if zip_file else download_zip(url, chunk_size=chunk_size, offline=offline)
 
     with tempfile.TemporaryDirectory() as tmpdir:
         tmp_extracted = Path(tmpdir, "extracted")
@@ -25,19 +129,121 @@ def fetch_and_prepare_icons():
         # Copy files into source/official, skipping __MACOSX & .svg
         copy_and_normalize(tmp_extracted)
 
-    # Remove local zip after extraction
-    zip_path.unlink(missing_ok=True)
     print("Icon set successfully fetched and placed in source/official.")
 
-def download_zip(url: str) -> Path:
-    response = requests.get(url, stream=True)
+def download_zip(url: str, chunk_size: int = DEFAULT_CHUNK_SIZE, offline: bool = False,
+                 cache_dir: Path = DOWNLOAD_CACHE) -> Path:
+    """
+    Return the path of a cached copy of `url`, downloading only when needed.
+
+    The archive is stored with its ETag/Last-Modified and revalidated with a
+    conditional GET, so an unchanged archive (304) costs no transfer. An
+    interrupted download is resumed with a Range request guarded by If-Range.
+    With `offline`, the cached archive is used without touching the network.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    stem = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    zip_path = cache_dir / f"{stem}.zip"
+    part_path = cache_dir / f"{stem}.zip.part"
+    meta_path = cache_dir / f"{stem}.json"
+    meta = _read_json(meta_path)
+
+    if offline:
+        if not zip_path.exists():
+            raise FileNotFoundError(f"No cached archive for {url}; run without --offline first.")
+        print(f"Offline: using cached archive {zip_path}.")
+        return zip_path
+
+    headers = {}
+    partial = meta.get("partial", {})
+    resume_from = part_path.stat().st_size if part_path.exists() else 0
+    if resume_from and (partial.get("etag") or partial.get("last_modified")):
+        headers["Range"] = f"bytes={resume_from}-"
+        headers["If-Range"] = partial.get("etag") or partial.get("last_modified")
+    elif zip_path.exists():
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    import requests
+    response = requests.get(url, headers=headers, stream=True, timeout=60)
+    if response.status_code == 304:
+        print(f"Cached archive is up to date ({zip_path}).")
+        return zip_path
+    if response.status_code == 416 and "Range" in headers:
+        # Nothing left past the .part: a run that died before promoting it, or a shorter remote file
+        response.close()
+        if _unsatisfied_size(response) == resume_from:
+            print(f"Download of {url} was already complete.")
+            return _promote(part_path, zip_path, meta_path, partial, url)
+        part_path.unlink(missing_ok=True)
+        meta.pop("partial", None)
+        _write_json(meta_path, meta)
+        print(f"Cached partial download of {url} doesn't match the server; restarting it.")
+        return download_zip(url, chunk_size=chunk_size, offline=offline, cache_dir=cache_dir)
     response.raise_for_status()
-    zip_path = Path("google_cloud_icons.zip")
-    with open(zip_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
+
+    validators = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    if response.status_code == 206:
+        if _range_start(response) != resume_from:
+            part_path.unlink(missing_ok=True)
+            raise IOError(f"Server resumed {url} at the wrong offset; run again to restart.")
+        mode = "ab"
+        print(f"Resuming download at {resume_from} bytes.")
+    else:
+        mode = "wb"
+    meta["partial"] = validators
+    _write_json(meta_path, meta)
+
+    with open(part_path, mode) as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
             f.write(chunk)
+
+    expected = _expected_size(response)
+    if expected is not None and part_path.stat().st_size != expected:
+        raise IOError(f"Download of {url} incomplete; run again to resume.")
+
+    return _promote(part_path, zip_path, meta_path, validators, url)
+
+def _promote(part_path, zip_path, meta_path, validators, url):
+    """Make a finished .part the cached archive and record the validators it was fetched with."""
+    os.replace(part_path, zip_path)
+    meta = dict(validators, url=url, size=zip_path.stat().st_size)
+    _write_json(meta_path, meta)
     return zip_path
 
+def _range_start(response):
+    m = re.match(r"bytes (\d+)-", response.headers.get("Content-Range", ""))
+    return int(m.group(1)) if m else None
+
+def _expected_size(response):
+    """Total size of the resource, when the server says."""
+    m = re.match(r"bytes \d+-\d+/(\d+)", response.headers.get("Content-Range", ""))
+    if m:
+        return int(m.group(1))
+    if response.status_code == 200 and "Content-Length" in response.headers and not response.headers.get("Content-Encoding"):
+        return int(response.headers["Content-Length"])
+    return None
+
+def _unsatisfied_size(response):
+    """Total size from a 416's Content-Range (`bytes */N`), when the server gives it."""
+    m = re.match(r"bytes \*/(\d+)", response.headers.get("Content-Range", ""))
+    return int(m.group(1)) if m else None
+
+def _read_json(path):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _write_json(path, data):
+    Path(path).write_text(json.dumps(data, indent=1), encoding="utf-8")
+
 def copy_and_normalize(extracted_dir: Path):
     """
     Recursively walk the unzipped directory,
@@ -1,68 +1,137 @@
-import sys
+import io
+import json
 import re
-import subprocess
 from pathlib import Path
 from PIL import Image
 
+from .cache import pixel_hash
+from .encoder import get_encoder, resolve_backend
+from .publish import write_file
+
 PUML_LICENSE_HEADER = """' SPDX-License-Identifier: CC-BY-ND-2.0
 """
 
+# Sprites are encoded from the opaque, full-size variant
+SPRITE_SOURCE_SUFFIX = "_opaque"
+
 class Icon:
-    def __init__(self, file_path, config):
+    def __init__(self, file_path, config, data=None):
+        # `data` holds the source PNG's bytes when it doesn't come from `file_path` on disk
         self.file_path = Path(file_path)
-        self.config = config
+        self.data = data
         self.source_name = self.file_path.name
         self.source_category = self.file_path.parent.name
         self.category = "Uncategorized"
         self.target = None
         self.color = "#000000"
-        self._set_values()
+        # `config` is a CompiledConfig; it isn't kept, so workers only get the resolved values
+        self._set_values(config)
+        self.sprite_options = config.sprite_options(self.source_category, self.source_name)
+
+    def generate_images(self, out_dir, variants):
+        """Write every (suffix, max size, transparency) variant as {target}{suffix}.png."""
+        out_files = []
+        for suffix, data in self.render_images(variants).items():
+            out_file = out_dir / f"{self.target}{suffix}.png"
+            write_file(out_file, data)
+            out_files.append(out_file)
+        return out_files
 
-    def generate_image(self, out_dir, color=True, max_target_size=128, transparency=False):
-        im = Image.open(self.file_path)
-        im.thumbnail((max_target_size, max_target_size))
-        if not transparency:
-            im = self._remove_transparency(im)
-        out_file = out_dir / f"{self.target}.png"
-        im.save(out_file, "PNG")
+    def render_images(self, variants):
+        """
+        Return every (suffix, max size, transparency) variant as PNG bytes, keyed
+        by suffix. The source is decoded once and thumbnailed once per size.
+        """
+        images = {}
+        resized = {}
+        with Image.open(io.BytesIO(self.data) if self.data is not None else self.file_path) as src:
+            src.load()
+            for suffix, max_target_size, transparency in variants:
+                if max_target_size not in resized:
+                    im = src.copy()
+                    im.thumbnail((max_target_size, max_target_size))
+                    resized[max_target_size] = im
+                im = resized[max_target_size]
+                if not transparency:
+                    im = self._remove_transparency(im)
+                out = io.BytesIO()
+                im.save(out, "PNG")
+                images[suffix] = out.getvalue()
+        return images
 
-    def generate_puml(self, out_dir):
-        png_file = out_dir / f"{self.target}.png"
+    def generate_puml(self, out_dir, encoder="auto", png_file=None, sprite_cache=None, optimise=False,
+                      png_data=None):
+        """
+        Write {target}.puml and return its content. The sprite is encoded from
+        `png_data` when given, otherwise from `png_file` (by default the
+        opaque variant in `out_dir`). See `puml` for the other options.
+        """
+        if png_data is None:
+            png_data = Path(png_file or out_dir / f"{self.target}{SPRITE_SOURCE_SUFFIX}.png").read_bytes()
+        content = self.puml(png_data, encoder=encoder, sprite_cache=sprite_cache, optimise=optimise)
+        write_file(out_dir / f"{self.target}.puml", content.encode("utf-8"))
+        return content
+
+    def puml(self, png_data, encoder="auto", sprite_cache=None, optimise=False):
+        """
+        Return the icon's .puml content with its sprite encoded from the PNG
+        bytes `png_data`. With a `sprite_cache`, an image already encoded under
+        another name is reused instead of encoded again. With `optimise`, the
+        sprite is the smallest encoding within the icon's sprite options and
+        `sprite_info` describes it. Sets `pixel_hash`, which identifies
+        duplicate images.
+        """
+        with Image.open(io.BytesIO(png_data)) as im:
+            self.pixel_hash = pixel_hash(im)
+        if optimise:
+            params = "optimise:" + json.dumps(self.sprite_options, sort_keys=True)
+        else:
+            params = f"16z:{resolve_backend(encoder)}"
+        cached = sprite_cache.get(self.pixel_hash, params, self.target) if sprite_cache else None
+        if cached:
+            sprite, self.sprite_info = cached
+        else:
+            # Encoder errors propagate so the build can report every failed icon
+            if optimise:
+                sprite, self.sprite_info = self._optimise_sprite(png_data)
+            else:
+                sprite, self.sprite_info = get_encoder(encoder).encode_bytes(png_data, self.target, "16z"), None
+            if sprite_cache:
+                sprite_cache.put(self.pixel_hash, params, self.target, sprite, self.sprite_info)
         content = PUML_LICENSE_HEADER
-        try:
-            result = subprocess.run(
-                ["java", "-jar", "scripts/plantuml.jar", "-encodesprite", "16z", str(png_file)],
-                capture_output=True,
-                check=True,
+        content += sprite
+        content += f"GCPEntityColoring({self.target})\n"
+        content += f"!define {self.target}(e_alias, e_label, e_techn) GCPEntity(e_alias, e_label, e_techn, {self.color}, {self.target}, {self.target})\n"
+        content += f"!define {self.target}(e_alias, e_label, e_techn, e_descr) GCPEntity(e_alias, e_label, e_techn, e_descr, {self.color}, {self.target}, {self.target})\n"
+        content += f"!define {self.target}Participant(p_alias, p_label, p_techn) GCPParticipant(p_alias, p_label, p_techn, {self.color}, {self.target}, {self.target})\n"
+        content += f"!define {self.target}Participant(p_alias, p_label, p_techn, p_descr) GCPParticipant(p_alias, p_label, p_techn, p_descr, {self.color}, {self.target}, {self.target})\n"
+        return content
+
+    def _optimise_sprite(self, png_data):
+        from . import sprite
+        options = self.sprite_options
+        # YAML reads plain levels such as 16 as numbers
+        with Image.open(io.BytesIO(png_data)) as im:
+            return sprite.optimise(
+                im,
+                self.target,
+                max_error=options.get("MaxError", 0.015),
+                levels=[str(level) for level in options.get("Levels", sprite.LEVELS)],
+                sizes=options.get("Sizes", ()),
+                level=str(options["Level"]) if "Level" in options else None,
+                size=options.get("Size"),
             )
-            content += result.stdout.decode("UTF-8")
-            content += f"GCPEntityColoring({self.target})\n"
-            content += f"!define {self.target}(e_alias, e_label, e_techn) GCPEntity(e_alias, e_label, e_techn, {self.color}, {self.target}, {self.target})\n"
-            content += f"!define {self.target}(e_alias, e_label, e_techn, e_descr) GCPEntity(e_alias, e_label, e_techn, e_descr, {self.color}, {self.target}, {self.target})\n"
-            content += f"!define {self.target}Participant(p_alias, p_label, p_techn) GCPParticipant(p_alias, p_label, p_techn, {self.color}, {self.target}, {self.target})\n"
-            content += f"!define {self.target}Participant(p_alias, p_label, p_techn, p_descr) GCPParticipant(p_alias, p_label, p_techn, p_descr, {self.color}, {self.target}, {self.target})\n"
-        except Exception as e:
-            print(f"Error generating puml for {self.target}: {e}")
-            sys.exit(1)
-        out_path = out_dir / f"{self.target}.puml"
-        out_path.write_text(content, encoding="utf-8")
 
-    def _set_values(self):
+    def _set_values(self, config):
         # Attempt to find matching config entry
-        cats = self.config.get("Categories", [])
-        for cat_item in cats:
-            cat_name = cat_item.get("Name", "Uncategorized")
-            src_dir = cat_item.get("SourceDir", "")
-            for svc in cat_item.get("Services", []):
-                if svc["Source"] == self.source_name and src_dir == self.source_category:
-                    self.category = cat_name
-                    self.target = svc["Target"]
-                    self.color = _resolve_color(svc, cat_item, self.config)
-                    return
+        match = config.lookup(self.source_category, self.source_name)
+        if match:
+            self.category, self.target, self.color = match
+            return
 
         # If no match, use fallback
         self.target = self._make_name(self.source_name)
-        self.color = self.config["Defaults"]["Category"].get("Color", "#000000")
+        self.color = config.default_color
 
     def _make_name(self, name):
         base = name.replace(".png", "")
@@ -71,22 +140,24 @@ class Icon:
         return re.sub(r'\W+', '_', base)
 
     def _remove_transparency(self, image, bg=(255,255,255)):
-        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
-            alpha = image.convert("RGBA").split()[-1]
-            new_bg = Image.new("RGBA", image.size, bg + (255,))
-            new_bg.paste(image, mask=alpha)
-            return new_bg
-        return image
+        return remove_transparency(image, bg)
 
-def _resolve_color(service_entry, category_entry, config):
-    # Check service, category, or default
-    if "Color" in service_entry:
-        return _lookup_color(service_entry["Color"], config)
-    if "Color" in category_entry:
-        return _lookup_color(category_entry["Color"], config)
-    defaults = config.get("Defaults", {}).get("Category", {})
-    return defaults.get("Color", "#000000")
+def alias_puml(content, target, canonical):
+    """
+    Rewrite an icon's puml to draw `canonical`'s sprite: drop its own sprite
+    block and point its macros at the canonical sprite. Only valid where the
+    canonical icon's puml is included too.
+    """
+    from .sprite import SPRITE_RE
+    m = SPRITE_RE.search(content)
+    if m:
+        content = content[:m.start()] + content[m.end():].lstrip("\n")
+    return content.replace(f", {target}, {target})", f", {canonical}, {target})")
 
-def _lookup_color(color_key, config):
-    colors = config.get("Defaults", {}).get("Colors", {})
-    return colors.get(color_key, "#4284F3")
\ No newline at end of file
+def remove_transparency(image, bg=(255,255,255)):
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        alpha = image.convert("RGBA").split()[-1]
+        new_bg = Image.new("RGBA", image.size, bg + (255,))
+        new_bg.paste(image, mask=alpha)
+        return new_bg
+    return image
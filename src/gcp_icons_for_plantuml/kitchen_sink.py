@@ -1,56 +1,51 @@
-import os
 import random
 from pathlib import Path
 
-def generate_kitchen_sync_example(grid_size, output_dir):
+from .manifest import load_manifest
+
+TOPOLOGIES = ("random", "layered", "scale-free", "clustered")
+
+def generate_kitchen_sync_example(grid_size, output_dir, library=None):
     """
     Generate a PlantUML file with an NxN grid of all icons.
+    With an in-memory `library`, its files are inlined instead of included from dist/.
     """
     dist_path = Path("dist")
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    # Prepare the .puml content
-    puml_content = "@startuml KitchenSink\n\n"
-    puml_content += "' Shared macros\n"
-    puml_content += "!include ../dist/GCPCommon.puml\n\n"
-
-    # Gather all individual macros from `dist/*/*.puml` (excluding `all.puml`)
-    all_macro_files = sorted(dist_path.glob("*/**/*.puml"))
-    all_macros = [file.stem for file in all_macro_files if file.name != "all.puml"]
-
-    if not all_macros:
-        raise FileNotFoundError("No individual macros found in dist/. Run the build command first.")
-
-    # Include all categories' `all.puml` files (for completeness)
-    all_puml_files = sorted(dist_path.glob("*/all.puml"))
-    for puml_file in all_puml_files:
-        puml_content += f"!include ../{str(puml_file)}\n"
-
-    puml_content += "\nLAYOUT_TOP_DOWN\n"
-    puml_content += f"title \"Kitchen Sink Example: {grid_size}x{grid_size}\"\n\n"
+    # Gather all individual macros from the build manifest
+    manifest = _load_icons_manifest(dist_path, library)
+    entries = manifest["icons"]
+    count = grid_size * grid_size
+    labels = _labels(entries)
 
-    # Add grid layout
-    puml_content += "rectangle \"Icon Grid\" as grid {\n"
-
-    # Generate a grid of icons using available macros
-    macro_index = 0
-    for row in range(grid_size):
-        for col in range(grid_size):
-            # Cycle through available macros (wrap-around if necessary)
-            macro_name = all_macros[macro_index % len(all_macros)]
-            alias = f"icon_{row}_{col}"
-            label = macro_name.replace("_", " ").title()  # Convert macro name to Title Case
-            puml_content += f"  {macro_name}({alias}, \"{label}\", \"Technology\")\n"
-            macro_index += 1
-
-    puml_content += "}\n"
-    puml_content += "\n@enduml"
-
-    # Save to file
     output_file = output_path / f"kitchen-sync-{grid_size}x{grid_size}.puml"
-    output_file.write_text(puml_content, encoding="utf-8")
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("@startuml KitchenSink\n\n")
+        f.write("' Shared macros\n")
+        _write_include(f, "GCPCommon.puml", library)
+        f.write("\n")
+
+        # Include the `all.puml` of each category the grid uses
+        used = {entries[i % len(entries)]["category"] for i in range(min(count, len(entries)))}
+        for category in sorted(used):
+            _write_include(f, manifest["categories"][category]["all"], library)
+
+        f.write("\nLAYOUT_TOP_DOWN\n")
+        f.write(f"title \"Kitchen Sink Example: {grid_size}x{grid_size}\"\n\n")
+
+        # Add grid layout, cycling through available macros (wrap-around if necessary)
+        f.write("rectangle \"Icon Grid\" as grid {\n")
+        for i in range(count):
+            entry = entries[i % len(entries)]
+            row, col = divmod(i, grid_size)
+            f.write(f"  {entry['target']}(icon_{row}_{col}, \"{labels[entry['target']]}\", \"Technology\")\n")
+        f.write("}\n")
+        f.write("\n@enduml")
+
     print(f"Generated kitchen-sync example at {output_file}")
+    return output_file
 
 def generate_verification_examples(output_dir):
     """
@@ -60,16 +55,12 @@ def generate_verification_examples(output_dir):
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    # Gather all individual macros from `dist/*/*.puml` (excluding `all.puml`)
-    all_macro_files = sorted(dist_path.glob("*/**/*.puml"))
-    all_macros = [file.stem for file in all_macro_files if file.name != "all.puml"]
-
-    if not all_macros:
-        raise FileNotFoundError("No individual macros found in dist/. Run the build command first.")
+    # Gather all individual macros from the build manifest
+    manifest = _load_icons_manifest(dist_path)
 
-    for macro_file in all_macro_files:
-        category = macro_file.parent.name
-        macro_name = macro_file.stem
+    for entry in manifest["icons"]:
+        category = entry["category"]
+        macro_name = entry["target"]
         label = macro_name.replace("_", " ").title()
 
         # Generate a .puml file for the macro
@@ -89,63 +80,144 @@ def generate_verification_examples(output_dir):
 
     print(f"Generated verification examples in {output_path}")
 
-import random
-from pathlib import Path
-
-
-def generate_complex_diagram(output_dir, max_connections=5, num_nodes=100):
+def generate_complex_diagram(output_dir, max_connections=5, num_nodes=100, topology="random", seed=None,
+                             cluster_size=20, library=None):
     """
     Generate a large, interconnected network diagram with icons.
+
+    The file is streamed, so memory stays flat however many nodes and edges
+    are asked for, and the same seed always gives the same diagram.
+    Topologies:
+      random      each node links to up to `max_connections` others
+      layered     nodes in rows of ~sqrt(n), each linking into the next row
+      scale-free  each node links back to earlier ones, biased towards the
+                  first few, so a handful of hubs collect most edges
+      clustered   nodes grouped by category in nested rectangles, linking
+                  mostly within their own cluster
+    With an in-memory `library`, its files are inlined instead of included from dist/.
     """
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"Unknown topology: {topology}")
     dist_path = Path("dist")
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+
+    # Gather all individual macros from the build manifest
+    manifest = _load_icons_manifest(dist_path, library)
+    entries = manifest["icons"]
+    if topology == "clustered":
+        # One category per cluster, cycling through the categories' icons
+        by_category = {}
+        for entry in entries:
+            by_category.setdefault(entry["category"], []).append(entry)
+        clusters = list(by_category.values())
+        cluster_size = max(1, cluster_size)
+
+        def entry_for(i):
+            members = clusters[(i // cluster_size) % len(clusters)]
+            return members[(i % cluster_size) % len(members)]
+    else:
+        def entry_for(i):
+            return entries[i % len(entries)]
+
+    labels = _labels(entries)
+    # entry_for cycles within len(entries) * cluster_size nodes, so that's enough to see every macro used
+    used = {}
+    for i in range(min(num_nodes, len(entries) * max(1, cluster_size))):
+        entry = entry_for(i)
+        used[entry["target"]] = entry
 
-    # Gather all individual macros from `dist/*/*.puml` (excluding `all.puml`)
-    all_macro_files = sorted(dist_path.glob("*/**/*.puml"))
-    all_macros = [file.stem for file in all_macro_files if file.name != "all.puml"]
-
-    if not all_macros:
-        raise FileNotFoundError("No individual macros found in dist/. Run the build command first.")
-
-    # Prepare the .puml content
-    puml_content = "@startuml ComplexDiagram\n\n"
-    puml_content += "' Shared macros\n"
-    puml_content += "!include ../dist/GCPCommon.puml\n\n"
-
-    # Include all macros
-    for macro_file in all_macro_files:
-        category = macro_file.parent.name
-        puml_content += f"!include ../dist/{category}/{macro_file.name}\n"
-
-    puml_content += "\nLAYOUT_LEFT_RIGHT\n"
-    puml_content += "title \"Complex Network Diagram\"\n\n"
-
-    # Create nodes
-    nodes = []
-    used_aliases = set()  # Track used aliases
-    for i in range(num_nodes):
-        macro_name = all_macros[i % len(all_macros)]  # Cycle through macros
-        alias = f"node_{i}"  # Unique alias for each node
-        while alias in used_aliases:  # Ensure no duplicates
-            alias = f"node_{i}_{random.randint(0, 9999)}"
-        used_aliases.add(alias)  # Mark alias as used
-        label = macro_name.replace("_", " ").title()
-        nodes.append((alias, macro_name, label))
-        puml_content += f"{macro_name}({alias}, \"{label}\", \"Technology\")\n"
-
-    # Randomly connect nodes
-    for node in nodes:
-        alias, _, _ = node
-        connections = random.sample(nodes, min(max_connections, len(nodes)))
-        for conn in connections:
-            target_alias, _, _ = conn
-            if alias != target_alias:  # Avoid self-loops
-                puml_content += f"{alias} --> {target_alias}\n"
-
-    puml_content += "\n@enduml"
-
-    # Save to file
     output_file = output_path / "complex-network-diagram.puml"
-    output_file.write_text(puml_content, encoding="utf-8")
-    print(f"Generated complex network diagram at {output_file}")
\ No newline at end of file
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("@startuml ComplexDiagram\n\n")
+        f.write("' Shared macros\n")
+        _write_include(f, "GCPCommon.puml", library)
+        f.write("\n")
+
+        # Include only the macros the diagram uses
+        for target in sorted(used):
+            _write_include(f, used[target]["puml"], library)
+
+        f.write("\nLAYOUT_LEFT_RIGHT\n")
+        f.write(f"title \"Complex Network Diagram ({topology}, {num_nodes} nodes)\"\n\n")
+
+        # Create nodes
+        if topology == "clustered":
+            _write_clustered_nodes(f, num_nodes, cluster_size, entry_for, labels)
+        else:
+            for i in range(num_nodes):
+                target = entry_for(i)["target"]
+                f.write(f"{target}(node_{i}, \"{labels[target]}\", \"Technology\")\n")
+
+        # Connect nodes
+        for source, target in _edges(topology, num_nodes, max_connections, rng, cluster_size):
+            f.write(f"node_{source} --> node_{target}\n")
+
+        f.write("\n@enduml")
+
+    print(f"Generated complex network diagram at {output_file}")
+    return output_file
+
+def _write_clustered_nodes(f, num_nodes, cluster_size, entry_for, labels, clusters_per_group=5):
+    """Clusters of `cluster_size` nodes, grouped `clusters_per_group` at a time in outer rectangles."""
+    group_size = cluster_size * clusters_per_group
+    for group_start in range(0, num_nodes, group_size):
+        f.write(f"rectangle \"Group {group_start // group_size}\" as group_{group_start // group_size} {{\n")
+        for start in range(group_start, min(group_start + group_size, num_nodes), cluster_size):
+            category = entry_for(start)["category"]
+            f.write(f"  rectangle \"{category}\" as cluster_{start // cluster_size} {{\n")
+            for i in range(start, min(start + cluster_size, num_nodes)):
+                target = entry_for(i)["target"]
+                f.write(f"    {target}(node_{i}, \"{labels[target]}\", \"Technology\")\n")
+            f.write("  }\n")
+        f.write("}\n")
+
+def _edges(topology, num_nodes, max_connections, rng, cluster_size):
+    """Yield (source, target) node indices without holding the graph in memory."""
+    if num_nodes < 2:
+        return
+    k = min(max_connections, num_nodes - 1)
+    if topology == "random":
+        for i in range(num_nodes):
+            for j in rng.sample(range(num_nodes), k):
+                if j != i:  # Avoid self-loops
+                    yield i, j
+    elif topology == "layered":
+        width = max(1, int(num_nodes ** 0.5))
+        for i in range(num_nodes - width):
+            next_start = (i // width + 1) * width
+            next_end = min(next_start + width, num_nodes)
+            for j in rng.sample(range(next_start, next_end), min(k, next_end - next_start)):
+                yield i, j
+    elif topology == "scale-free":
+        # Power-law index sampling: u ** 3 piles targets onto the lowest indices
+        for i in range(1, num_nodes):
+            for _ in range(min(k, i)):
+                yield i, int(i * rng.random() ** 3)
+    elif topology == "clustered":
+        for i in range(num_nodes):
+            start = i - i % cluster_size
+            end = min(start + cluster_size, num_nodes)
+            for _ in range(k):
+                # Four in five edges stay inside the cluster
+                j = rng.randrange(start, end) if rng.random() < 0.8 else rng.randrange(num_nodes)
+                if j != i:
+                    yield i, j
+
+def _labels(entries):
+    # Convert macro name to Title Case
+    return {entry["target"]: entry["target"].replace("_", " ").title() for entry in entries}
+
+def _write_include(f, path, library=None):
+    """`!include` a file from dist/, or inline its text from an in-memory library."""
+    if library is None:
+        f.write(f"!include ../dist/{path}\n")
+    else:
+        f.write(library.text(path).rstrip("\n") + "\n")
+
+def _load_icons_manifest(dist_path, library=None):
+    manifest = library.manifest if library is not None else load_manifest(dist_path, fallback=True)
+    if not manifest["icons"]:
+        raise FileNotFoundError("No individual macros found in dist/. Run the build command first.")
+    return manifest
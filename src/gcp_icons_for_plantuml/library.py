@@ -0,0 +1,148 @@
+import hashlib
+import json
+import zipfile
+from functools import partial
+from pathlib import Path
+
+from . import config as config_module
+from .atlas import write_atlas
+from .builder import (category_all_content, encode_icon, icon_record, image_variants, markdown_rows, markdown_text,
+                      resize_icon)
+from .icon import Icon
+from .manifest import MANIFEST_NAME, build_manifest, write_manifest
+from .publish import write_file
+from .scheduler import run_pipeline
+
+SOURCE_DIR = Path("source")
+
+class Library:
+    """
+    A built icon library held in memory: the bytes of every file a build puts
+    in dist/, keyed by dist-relative path, and the manifest records indexing
+    them by macro name. Write it to a directory or a zip, or hand it to the
+    diagram generators, which then inline the includes they need.
+    """
+
+    def __init__(self, records, categories, files, failures=()):
+        self.records = sorted(records, key=lambda r: (r["category"], r["target"]))
+        self.categories = dict(sorted(categories.items()))
+        self.files = files
+        self.failures = list(failures)
+        self.index = {record["target"]: record for record in self.records}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __contains__(self, macro):
+        return macro in self.index
+
+    def __getitem__(self, macro):
+        """The manifest record for `macro`."""
+        return self.index[macro]
+
+    @property
+    def manifest(self):
+        return build_manifest(self.records, self.categories)
+
+    def text(self, path):
+        """A file's content as text, by dist-relative path."""
+        return self.files[path].decode("utf-8")
+
+    def puml(self, macro):
+        return self.text(self.index[macro]["puml"])
+
+    def write(self, dist_path="dist", atlas=True, binary_manifest=False):
+        """Write every file and the manifest under `dist_path`, plus the sprite atlas unless `atlas` is false."""
+        dist_path = Path(dist_path)
+        for path, data in self.files.items():
+            out = dist_path / path
+            out.parent.mkdir(parents=True, exist_ok=True)
+            write_file(out, data)
+        if atlas:
+            write_atlas(self.records, dist_path)
+        write_manifest(self.records, self.categories, dist_path, binary=binary_manifest)
+
+    def write_zip(self, file, prefix="dist/"):
+        """
+        Stream every file and manifest.json into a zip. `file` is a path or a
+        writable binary file object, which needn't be seekable.
+        """
+        with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for path, data in sorted(self.files.items()):
+                zf.writestr(prefix + path, data)
+            zf.writestr(prefix + MANIFEST_NAME, json.dumps(self.manifest, indent=1))
+
+def build_library(config=None, sources=None, commons=None, encoder="auto", optimise_sprites=False, use_cache=False,
+                  jobs=1):
+    """
+    Build the icon library in memory and return it as a `Library`. Images and
+    sprite text pass between the resize and encode steps as bytes; nothing is
+    read back from or written to dist/.
+
+    config   a CompiledConfig, the parsed config.yml as a dict, a path to a
+             config.yml, or None for scripts/config.yml
+    sources  None for every PNG under source/official, an iterable of PNG
+             paths, or a mapping of "SourceDir/Source.png" to PNG bytes
+    commons  None for source/*.puml, or a mapping of file name to text
+    use_cache
+             reuse and fill the on-disk sprite cache
+    jobs     worker processes per step; 1 keeps everything in this process
+    """
+    config = _compile_config(config)
+    icons = _icons(sources, config)
+    variants = image_variants(config)
+    if commons is None:
+        commons = {f.name: f.read_text(encoding="utf-8") for f in sorted(SOURCE_DIR.glob("*.puml"))}
+
+    files = {name: text.encode("utf-8") for name, text in commons.items()}
+    records = []
+    failures = []
+
+    def on_result(icon, result):
+        _, icon_files, content, _ = result
+        files.update(icon_files)
+        records.append(icon_record(icon, icon_files, content))
+
+    def on_error(icon, stage, e):
+        failures.append({"source": str(icon.file_path), "target": icon.target, "stage": stage, "error": str(e)})
+
+    # The build's own resize and encode stages, minus its write to dist/
+    stages = [
+        ("resize", partial(resize_icon, variants=variants), jobs),
+        ("encode", partial(encode_icon, variants=variants, encoder=encoder, use_cache=use_cache,
+                           optimise=optimise_sprites), jobs),
+    ]
+    run_pipeline(icons, stages, on_result, on_error)
+
+    # Category all.puml files and GCPSymbols.md, straight from the in-memory files
+    built = {record["source"] for record in records}
+    categories = {}
+    blocks = {}
+    for c in sorted({record["category"] for record in records}):
+        category_records = [r for r in records if r["category"] == c]
+        content = category_all_content(category_records, lambda rel: files[rel].decode("utf-8"))
+        files[f"{c}/all.puml"] = content
+        categories[c] = {"all": f"{c}/all.puml", "sha256": hashlib.sha256(content).hexdigest()}
+        blocks[c] = markdown_rows(c, [i for i in icons if i.category == c and str(i.file_path) in built])
+    files["GCPSymbols.md"] = markdown_text(blocks).encode("utf-8")
+    return Library(records, categories, files, failures)
+
+def _compile_config(config):
+    if config is None:
+        return config_module.load()
+    if isinstance(config, config_module.CompiledConfig):
+        return config
+    if isinstance(config, dict):
+        return config_module.compile_config(config)
+    import yaml
+    return config_module.compile_config(yaml.safe_load(Path(config).read_bytes()))
+
+def _icons(sources, config):
+    if sources is None:
+        sources = sorted(Path(SOURCE_DIR, "official").glob("**/*.png"))
+    if isinstance(sources, dict):
+        return [Icon(name, config, data=data) for name, data in sources.items()]
+    return [Icon(str(path), config) for path in sources]
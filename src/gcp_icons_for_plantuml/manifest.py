@@ -0,0 +1,109 @@
+import json
+import zlib
+from pathlib import Path
+
+from .publish import write_file
+
+MANIFEST_NAME = "manifest.json"
+BINARY_MANIFEST_NAME = "manifest.bin"
+# manifest.bin is this header and zlib-compressed compact JSON: small, quick
+# to parse, and nothing in it runs when loaded from an untrusted dist/
+BINARY_MAGIC = b"GCPMANIFEST/1\n"
+MANIFEST_VERSION = 3
+
+def write_manifest(records, categories, dist_path, binary=False):
+    """
+    Record every icon the build produced in dist/manifest.json: category,
+    target, output files and their sha256, sprite size and level, and the
+    byte offset and length of its sprite inside the category all.puml.
+    Icons that render to the same image are listed together under
+    `duplicates`. With `binary`, also write the same data compressed to
+    manifest.bin for tools that load it often.
+    """
+    dist_path = Path(dist_path)
+    manifest = build_manifest(records, categories)
+    write_file(dist_path / MANIFEST_NAME, json.dumps(manifest, indent=1).encode("utf-8"))
+    binary_file = dist_path / BINARY_MANIFEST_NAME
+    if binary:
+        compact = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+        write_file(binary_file, BINARY_MAGIC + zlib.compress(compact))
+    elif binary_file.exists():
+        binary_file.unlink()
+
+def build_manifest(records, categories):
+    """The manifest `write_manifest` stores, as a dict."""
+    records = sorted(records, key=lambda r: (r["category"], r["target"]))
+    return {
+        "version": MANIFEST_VERSION,
+        "categories": dict(sorted(categories.items())),
+        "icons": records,
+        "duplicates": duplicate_clusters(records),
+    }
+
+def load_manifest(dist_path, fallback=False):
+    """
+    Load the build manifest, from manifest.bin when the build wrote one.
+    With `fallback`, a dist/ without a manifest is scanned instead (see
+    `scan_dist`).
+    """
+    dist_path = Path(dist_path)
+    try:
+        data = (dist_path / BINARY_MANIFEST_NAME).read_bytes()
+    except FileNotFoundError:
+        data = b""
+    # Anything else by that name, such as an older pickled copy, is ignored
+    if data.startswith(BINARY_MAGIC):
+        return json.loads(zlib.decompress(data[len(BINARY_MAGIC):]))
+    manifest_file = dist_path / MANIFEST_NAME
+    if not manifest_file.exists():
+        if fallback:
+            return scan_dist(dist_path)
+        raise FileNotFoundError(f"No {MANIFEST_NAME} in {dist_path}. Run the build command first.")
+    return json.loads(manifest_file.read_text(encoding="utf-8"))
+
+def scan_dist(dist_path):
+    """
+    A manifest pieced together from dist/*/*.puml, for a dist/ built before
+    manifests existed, such as the one checked into the repo. It names each
+    icon's category, macro and files; sprite details and hashes are missing.
+    """
+    dist_path = Path(dist_path)
+    categories = {}
+    icons = []
+    for puml_file in sorted(dist_path.glob("*/*.puml")):
+        category = puml_file.parent.name
+        rel = puml_file.relative_to(dist_path).as_posix()
+        if puml_file.name == "all.puml":
+            categories[category] = {"all": rel}
+            continue
+        icons.append({
+            "category": category,
+            "target": puml_file.stem,
+            "puml": rel,
+            "png": f"{category}/{puml_file.stem}.png",
+            "sprite": {},
+        })
+    return {"version": MANIFEST_VERSION, "categories": categories, "icons": icons, "duplicates": []}
+
+def duplicate_clusters(records):
+    """Groups of two or more icons whose sprites were encoded from identical pixels."""
+    by_pixels = {}
+    for record in records:
+        by_pixels.setdefault(record["sprite"].get("pixels"), []).append(record)
+    by_pixels.pop(None, None)
+    return [
+        {"pixels": pixels, "icons": [{"source": r["source"], "target": r["target"]} for r in group]}
+        for pixels, group in sorted(by_pixels.items()) if len(group) > 1
+    ]
+
+def macro_index(manifest):
+    """Map each icon's macro name to its manifest entry."""
+    return {entry["target"]: entry for entry in manifest["icons"]}
+
+def read_sprite(manifest_entry, dist_path):
+    """Read one icon's sprite block straight out of its category all.puml."""
+    sprite = manifest_entry["sprite"]
+    all_file = Path(dist_path) / manifest_entry["category"] / "all.puml"
+    with open(all_file, "rb") as f:
+        f.seek(sprite["offset"])
+        return f.read(sprite["length"]).decode("utf-8")
@@ -0,0 +1,120 @@
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+class Profiler:
+    """
+    Wall and CPU time per build stage, plus per-icon step timings that the
+    pool workers send back with their results. Disabled profilers record
+    nothing and write nothing.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = []
+        self.icons = []
+        # [wall, cpu] spent in nested stages, one entry per stage still running
+        self._nested = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a stage. A stage started inside another counts only towards
+        itself: its time is taken out of the outer stage's wall and cpu, so
+        the stages add up to the build without double counting. `total`
+        keeps the outer stage's full span for the trace.
+        """
+        if not self.enabled:
+            yield
+            return
+        start, wall, cpu = time.time(), time.perf_counter(), time.process_time()
+        self._nested.append([0.0, 0.0])
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            nested_wall, nested_cpu = self._nested.pop()
+            if self._nested:
+                self._nested[-1][0] += wall
+                self._nested[-1][1] += cpu
+            self.stages.append({
+                "name": name,
+                "start": start,
+                "wall": wall - nested_wall,
+                "cpu": cpu - nested_cpu,
+                "total": wall,
+                "pid": os.getpid(),
+            })
+
+    def add_icon_timings(self, timings):
+        if self.enabled:
+            self.icons.extend(timings)
+
+    def write(self, out_dir, chrome_trace=False):
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        (out_dir / "profile.json").write_text(
+            json.dumps({"stages": self.stages, "icons": self.icons}, indent=1), encoding="utf-8")
+
+        with open(out_dir / "profile.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["kind", "name", "step", "wall_s", "cpu_s", "pid"])
+            for s in self.stages:
+                writer.writerow(["stage", s["name"], "", f"{s['wall']:.6f}", f"{s['cpu']:.6f}", s["pid"]])
+            for t in self.icons:
+                writer.writerow(["icon", t["icon"], t["step"], f"{t['wall']:.6f}", f"{t['cpu']:.6f}", t["pid"]])
+
+        if chrome_trace:
+            (out_dir / "trace.json").write_text(json.dumps(self._chrome_trace()), encoding="utf-8")
+
+    def summary(self, top=10):
+        # Stages that run more than once (e.g. all_puml per category) are summed
+        totals = {}
+        for s in self.stages:
+            total = totals.setdefault(s["name"], {"wall": 0.0, "cpu": 0.0})
+            total["wall"] += s["wall"]
+            total["cpu"] += s["cpu"]
+        lines = ["Stage                     wall (s)   cpu (s)"]
+        for name, total in sorted(totals.items(), key=lambda item: -item[1]["wall"]):
+            lines.append(f"{name:<24} {total['wall']:>9.3f} {total['cpu']:>9.3f}")
+
+        per_icon = {}
+        for t in self.icons:
+            per_icon.setdefault(t["icon"], {}).update({t["step"]: t["wall"]})
+        slowest = sorted(per_icon.items(), key=lambda item: -sum(item[1].values()))[:top]
+        if slowest:
+            lines.append("")
+            lines.append("Slowest icons                    resize (s) encode (s)  write (s)")
+            for name, steps in slowest:
+                lines.append(f"{name:<30} {steps.get('resize', 0):>11.3f} {steps.get('encode', 0):>10.3f} "
+                             f"{steps.get('write', 0):>10.3f}")
+        return "\n".join(lines)
+
+    def _chrome_trace(self):
+        """Complete ("X") events in the Chrome trace event format, one row per process."""
+        events = []
+        for s in self.stages:
+            events.append({"name": s["name"], "cat": "stage", "ph": "X", "pid": s["pid"], "tid": 0,
+                           "ts": s["start"] * 1e6, "dur": s["total"] * 1e6, "args": {"cpu_s": s["cpu"]}})
+        for t in self.icons:
+            events.append({"name": f"{t['step']} {t['icon']}", "cat": t["step"], "ph": "X", "pid": t["pid"], "tid": 0,
+                           "ts": t["start"] * 1e6, "dur": t["wall"] * 1e6, "args": {"cpu_s": t["cpu"]}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+@contextmanager
+def timed(timings, icon, step):
+    """Append one per-icon step timing to `timings`; cheap enough to always run."""
+    start, wall, cpu = time.time(), time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        timings.append({
+            "icon": icon,
+            "step": step,
+            "start": start,
+            "wall": time.perf_counter() - wall,
+            "cpu": time.process_time() - cpu,
+            "pid": os.getpid(),
+        })
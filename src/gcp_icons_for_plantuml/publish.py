@@ -0,0 +1,176 @@
+import ctypes
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+
+KEEP_GENERATIONS = 3
+GENERATION_RE = re.compile(r"^gen-(\d+)$")
+
+# renameat2() arguments for swapping two paths in one step (Linux 3.15+)
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+def write_file(path, data):
+    """
+    Replace `path` with `data` through a temporary file and a rename, leaving
+    it alone when it already holds exactly `data`. Files in dist/ can be hard
+    links shared with older generations, so they're never rewritten in place.
+    """
+    path = Path(path)
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return
+    except OSError:
+        pass
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+def generations_dir(dist_path):
+    """Where dist/'s staging directory and earlier generations live: .dist/ next to it."""
+    dist_path = Path(dist_path)
+    return dist_path.with_name(f".{dist_path.name}")
+
+def stage(dist_path, reuse=True):
+    """
+    Create the staging directory for the next build of `dist_path`. With
+    `reuse`, it starts as hard links to every published file, so a build
+    only writes what changed.
+    """
+    root = generations_dir(dist_path)
+    staging = root / "staging"
+    if staging.exists():
+        # Left behind by a build that didn't finish
+        shutil.rmtree(staging)
+    staging.mkdir(parents=True)
+    dist_path = Path(dist_path)
+    if reuse and dist_path.is_dir():
+        for path in dist_path.rglob("*"):
+            target = staging / path.relative_to(dist_path)
+            if path.is_dir():
+                target.mkdir(exist_ok=True)
+            else:
+                _link_or_copy(path, target)
+    return staging
+
+def publish(staging, dist_path, keep=KEEP_GENERATIONS):
+    """
+    Swap `staging` in as `dist_path`, which stays a real directory, and keep
+    the tree it replaces as the newest generation in .dist/. Files identical
+    to the replaced tree's are linked to them rather than stored twice, and
+    all but the newest `keep` generations are removed. Returns (the replaced
+    tree's generation path or None, files written, files shared), or None
+    when `staging` matches what's published, which is then left as it is.
+    """
+    dist_path = Path(dist_path)
+    previous = dist_path if dist_path.is_dir() else None
+    written, shared = _share_identical(staging, previous)
+    if not written and previous and _files(staging) == _files(previous):
+        shutil.rmtree(staging)
+        return None
+
+    if previous is None:
+        os.rename(staging, dist_path)
+        return None, written, shared
+    generation = generations_dir(dist_path) / f"gen-{_next_number(generations_dir(dist_path)):06d}"
+    _swap(staging, dist_path)
+    os.rename(staging, generation)
+    _prune(dist_path, keep)
+    return generation, written, shared
+
+def generations(dist_path):
+    """The kept earlier builds of `dist_path`, oldest first."""
+    root = generations_dir(dist_path)
+    found = sorted((int(m.group(1)), p) for p in root.glob("gen-*") if (m := GENERATION_RE.match(p.name)))
+    return [p for _, p in found]
+
+def rollback(dist_path, generation=None):
+    """
+    Swap `generation` (a name like gen-000003, by default the newest) back in
+    as `dist_path`. The tree it replaces is kept as the newest generation, so
+    a rollback can itself be rolled back. Returns the name of the generation
+    restored and the path the replaced tree is kept at.
+    """
+    kept = generations(dist_path)
+    if generation:
+        matches = [p for p in kept if p.name == generation]
+        if not matches:
+            raise ValueError(f"No generation {generation} in {generations_dir(dist_path)}.")
+        target = matches[0]
+    elif kept:
+        target = kept[-1]
+    else:
+        raise ValueError("No earlier generation to roll back to.")
+    replaced = generations_dir(dist_path) / f"gen-{_next_number(generations_dir(dist_path)):06d}"
+    _swap(target, Path(dist_path))
+    os.rename(target, replaced)
+    return target.name, replaced
+
+def _swap(staging, dist_path):
+    """
+    Put `staging` in place of `dist_path`, leaving the old tree at `staging`.
+    Where the kernel can exchange the two in one step, readers of dist/ see
+    one tree or the other, never neither; elsewhere dist/ is briefly missing
+    between two renames.
+    """
+    if _exchange(staging, dist_path):
+        return
+    old = staging.with_name(f"{staging.name}.old")
+    os.rename(dist_path, old)
+    os.rename(staging, dist_path)
+    os.rename(old, staging)
+
+def _exchange(a, b):
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        # No renameat2 in this libc
+        return False
+    # Fails on filesystems and kernels that can't exchange; the caller falls back
+    return renameat2(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE) == 0
+
+def _next_number(root):
+    numbers = [int(m.group(1)) for p in root.glob("gen-*") if (m := GENERATION_RE.match(p.name))]
+    return max(numbers, default=0) + 1
+
+def _share_identical(staging, previous):
+    """Link files the build wrote afresh to identical ones in the previous tree; count both kinds."""
+    written = shared = 0
+    for path in staging.rglob("*"):
+        if not path.is_file():
+            continue
+        st = path.stat()
+        if st.st_nlink > 1:
+            shared += 1
+            continue
+        old = previous / path.relative_to(staging) if previous else None
+        if old and old.is_file() and old.stat().st_size == st.st_size and old.read_bytes() == path.read_bytes():
+            tmp = path.with_name(f".{path.name}.link")
+            try:
+                os.link(old, tmp)
+            except OSError:
+                written += 1
+                continue
+            os.replace(tmp, path)
+            shared += 1
+        else:
+            written += 1
+    return written, shared
+
+def _files(directory):
+    return {p.relative_to(directory) for p in directory.rglob("*") if p.is_file()}
+
+def _prune(dist_path, keep):
+    for path in generations(dist_path)[:-max(1, keep)]:
+        shutil.rmtree(path)
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # e.g. a filesystem without hard links
+        shutil.copy2(src, dst)
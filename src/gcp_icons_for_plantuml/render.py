@@ -0,0 +1,149 @@
+import hashlib
+import multiprocessing
+import re
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+from .encoder import PLANTUML_JAR
+
+RENDER_CACHE = Path(".cache") / "render"
+FORMATS = ("png", "svg")
+
+# Bump when the cache key or output naming changes
+RENDER_CACHE_VERSION = 1
+
+INCLUDE_RE = re.compile(r"^\s*!include(?:_many|_once|url|sub)?\s+(.+?)\s*$")
+START_RE = re.compile(r"^\s*@startuml(?:\s+(\S+))?", re.M)
+ERROR_FILE_RE = re.compile(r"^Error line \d+ in file: (.+)$", re.M)
+
+def render(paths, out_dir=None, fmt="png", threads=None, use_cache=True, jar=PLANTUML_JAR, cache_root=RENDER_CACHE):
+    """
+    Render .puml files (or directories of them) with one PlantUML run.
+    Images are cached under a hash of the diagram and everything it includes,
+    so only new or changed diagrams reach the JVM. Each image is written to
+    `out_dir`, or next to its diagram when no directory is given.
+    Returns (rendered, cached, failed) lists of diagram paths.
+    """
+    diagrams = _collect(paths)
+    objects = Path(cache_root) / "objects"
+    jar_id = _jar_id(jar)
+
+    rendered, cached, failed = [], [], []
+    misses = []
+    for diagram in diagrams:
+        key = diagram_key(diagram, fmt, jar_id)
+        target = _target(diagram, out_dir, fmt)
+        obj = objects / key[:2] / f"{key}.{fmt}"
+        if use_cache and obj.exists():
+            if not target.exists() or target.read_bytes() != obj.read_bytes():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(obj, target)
+            cached.append(diagram)
+        else:
+            misses.append((diagram, target, obj))
+
+    for batch in _batches(misses, fmt):
+        ok, bad = _render_batch(batch, fmt, threads, jar, Path(cache_root))
+        rendered += ok
+        failed += bad
+    return rendered, cached, failed
+
+def diagram_key(diagram, fmt, jar_id=""):
+    """Hash of the output format, the PlantUML jar and every file the diagram includes."""
+    h = hashlib.sha256(f"{RENDER_CACHE_VERSION}\0{fmt}\0{jar_id}\0".encode("utf-8"))
+    seen = set()
+    pending = [Path(diagram)]
+    while pending:
+        path = pending.pop()
+        resolved = path.resolve()
+        if resolved in seen:
+            continue
+        seen.add(resolved)
+        try:
+            data = resolved.read_bytes()
+        except OSError:
+            h.update(f"missing:{path}\0".encode("utf-8"))
+            continue
+        h.update(data)
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            m = INCLUDE_RE.match(line)
+            if not m:
+                continue
+            ref = m.group(1).split("!", 1)[0]
+            if ref.startswith(("http://", "https://", "<")):
+                # Remote and stdlib includes are keyed by reference only
+                h.update(f"ref:{ref}\0".encode("utf-8"))
+            else:
+                pending.append(resolved.parent / ref)
+    return h.hexdigest()
+
+def default_threads():
+    return multiprocessing.cpu_count()
+
+def _collect(paths):
+    diagrams = []
+    for p in paths:
+        p = Path(p)
+        diagrams += sorted(p.glob("*.puml")) if p.is_dir() else [p]
+    return diagrams
+
+def _target(diagram, out_dir, fmt):
+    directory = Path(out_dir) if out_dir else diagram.parent
+    return directory / f"{diagram.stem}.{fmt}"
+
+def _output_name(diagram, fmt):
+    """The file PlantUML writes for a diagram: `@startuml name` wins over the file name."""
+    m = START_RE.search(diagram.read_text(encoding="utf-8", errors="replace"))
+    name = m.group(1) if m and m.group(1) else diagram.stem
+    return f"{name}.{fmt}"
+
+def _batches(misses, fmt):
+    """Split misses so no two diagrams in a run write the same output file."""
+    batches = []
+    for miss in misses:
+        name = _output_name(miss[0], fmt)
+        for batch in batches:
+            if name not in batch:
+                batch[name] = miss
+                break
+        else:
+            batches.append({name: miss})
+    return batches
+
+def _render_batch(batch, fmt, threads, jar, cache_root):
+    cache_root.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix="render-", dir=cache_root))
+    try:
+        cmd = ["java", "-jar", str(jar), f"-t{fmt}", "-nbthread", str(threads or default_threads()),
+               "-o", str(staging.resolve())]
+        cmd += [str(diagram) for diagram, _, _ in batch.values()]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        errored = {Path(f.strip()).resolve() for f in ERROR_FILE_RE.findall(result.stdout + result.stderr)}
+
+        ok, bad = [], []
+        for name, (diagram, target, obj) in batch.items():
+            out = staging / name
+            if not out.exists():
+                bad.append(diagram)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(out, target)
+            if diagram.resolve() in errored:
+                # PlantUML draws an error image; keep it visible but don't cache it
+                bad.append(diagram)
+                continue
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(out, obj)
+            ok.append(diagram)
+        return ok, bad
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def _jar_id(jar):
+    try:
+        st = Path(jar).stat()
+    except OSError:
+        return ""
+    return f"{st.st_size}:{st.st_mtime_ns}"
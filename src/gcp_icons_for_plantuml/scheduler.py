@@ -0,0 +1,87 @@
+import multiprocessing
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+def default_jobs():
+    return multiprocessing.cpu_count()
+
+def run_pipeline(items, stages, on_result, on_error, queue_size=None, profiler=None):
+    """
+    Push `items` through `stages`, a list of (name, fn, workers) tuples. Each
+    stage runs in its own process pool; the first fn gets the item and every
+    later one gets the previous stage's result.
+
+    A stage holds at most `queue_size` (default twice its workers) items in
+    flight or waiting for the next stage, so a fast stage can't run ahead of
+    a slow one. `on_result(item, result)` runs in this process as each item
+    leaves the last stage, in completion order. A failing item is passed to
+    `on_error(item, stage_name, exc)` and dropped; the rest carry on. If a
+    worker dies (killed for memory, a crash in Pillow), the items its pool had
+    in flight fail with BrokenProcessPool and the pool is replaced.
+    With a `profiler`, starting the pools is timed as its own stage.
+    """
+    if all(workers <= 1 for _, _, workers in stages) or len(items) <= 1:
+        _run_inline(items, stages, on_result, on_error)
+        return
+
+    with profiler.stage("pool_startup") if profiler else nullcontext():
+        pools = [ProcessPoolExecutor(max_workers=workers) for _, _, workers in stages]
+        # Workers only start with the first task, so wait for each pool to run one
+        for future in [pool.submit(_ready) for pool in pools]:
+            future.result()
+    limits = [queue_size or 2 * workers for _, _, workers in stages]
+    waiting = [deque() for _ in stages]
+    waiting[0].extend((item, item) for item in items)
+    running = [0] * len(stages)
+    in_flight = {}
+    try:
+        while in_flight or any(waiting):
+            for i, (_, fn, _) in enumerate(stages):
+                # Running items plus finished ones the next stage hasn't taken yet
+                while waiting[i] and running[i] + _queued(waiting, i + 1) < limits[i]:
+                    item, value = waiting[i].popleft()
+                    try:
+                        future = pools[i].submit(fn, value)
+                    except BrokenProcessPool:
+                        pools[i].shutdown(cancel_futures=True)
+                        pools[i] = ProcessPoolExecutor(max_workers=stages[i][2])
+                        future = pools[i].submit(fn, value)
+                    in_flight[future] = (item, i)
+                    running[i] += 1
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, i = in_flight.pop(future)
+                running[i] -= 1
+                try:
+                    value = future.result()
+                except Exception as e:
+                    on_error(item, stages[i][0], e)
+                    continue
+                if i + 1 < len(stages):
+                    waiting[i + 1].append((item, value))
+                else:
+                    on_result(item, value)
+    finally:
+        for pool in pools:
+            pool.shutdown(cancel_futures=True)
+
+def _ready():
+    return True
+
+def _queued(waiting, i):
+    return len(waiting[i]) if i < len(waiting) else 0
+
+def _run_inline(items, stages, on_result, on_error):
+    for item in items:
+        value = item
+        for name, fn, _ in stages:
+            try:
+                value = fn(value)
+            except Exception as e:
+                on_error(item, name, e)
+                break
+        else:
+            on_result(item, value)
@@ -0,0 +1,338 @@
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .bundler import bundle_content
+from .manifest import load_manifest, macro_index
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+BUNDLE_PATH = "/bundle"
+BUNDLE_CACHE_SIZE = 256
+# Seconds between checks of dist/ for a new build
+REFRESH_INTERVAL = 1.0
+MAX_HEADER_BYTES = 16 * 1024
+# Largest request body read and thrown away to keep a connection open
+MAX_DISCARD_BYTES = 64 * 1024
+
+# Already-compressed formats aren't worth gzipping again
+COMPRESSIBLE = ("text/", "application/json", "image/svg+xml")
+CONTENT_TYPES = {".puml": "text/plain; charset=utf-8", ".md": "text/markdown; charset=utf-8"}
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+class Resource:
+    """One response body, with its gzip variant and strong ETag worked out up front."""
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.gzip = None
+        if content_type.startswith(COMPRESSIBLE) and len(body) > 256:
+            packed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(packed) < len(body):
+                self.gzip = packed
+
+    def etag_for(self, gzipped):
+        # Each representation needs its own strong ETag
+        return self.etag[:-1] + '-gz"' if gzipped else self.etag
+
+class Index:
+    """
+    Every file under dist/ held in memory, keyed by URL path. At most every
+    `interval` seconds the tree is stat'ed again and, if any file was added,
+    removed or replaced, reloaded, so a rebuild shows up without restarting
+    the server.
+    """
+
+    def __init__(self, dist_path, interval=REFRESH_INTERVAL):
+        self.dist_path = Path(dist_path)
+        self.interval = interval
+        self.files = {}
+        self.macros = {}
+        self.bundles = {}
+        self.stamp = None
+        self.checked = None
+        self.refresh()
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.checked is not None and now - self.checked < self.interval:
+            return
+        self.checked = now
+        stamp = _tree_stamp(self.dist_path)
+        if stamp == self.stamp:
+            return
+        files = {}
+        for path in sorted(self.dist_path.rglob("*")):
+            if path.is_file():
+                rel = path.relative_to(self.dist_path).as_posix()
+                files["/" + rel] = Resource(path.read_bytes(), _content_type(path))
+        if "/gallery/index.html" in files:
+            files["/gallery/"] = files["/gallery/index.html"]
+        self.files = files
+        try:
+            self.macros = macro_index(load_manifest(self.dist_path))
+        except FileNotFoundError:
+            self.macros = {}
+        self.bundles = {}
+        self.stamp = stamp
+
+    def bundle(self, macros, commons):
+        """The bundle of `macros`, built from the in-memory files and kept for reuse."""
+        key = (tuple(sorted(macros)), tuple(commons))
+        resource = self.bundles.get(key)
+        if resource is None:
+            def read(rel):
+                return self.files["/" + rel].body.decode("utf-8")
+            content = bundle_content(key[0], list(commons), self.macros, read)
+            resource = Resource(content.encode("utf-8"), CONTENT_TYPES[".puml"])
+            if len(self.bundles) >= BUNDLE_CACHE_SIZE:
+                self.bundles.pop(next(iter(self.bundles)))
+            self.bundles[key] = resource
+        return resource
+
+def _tree_stamp(dist_path):
+    """
+    Path, inode, size and mtime of every file under `dist_path`. Builds
+    replace files rather than rewrite them, so a changed file always gets a
+    new inode, even when it's hard-linked and its mtime is an old one.
+    """
+    stamp = []
+    for dirpath, dirnames, filenames in os.walk(dist_path):
+        dirnames.sort()
+        for name in sorted(filenames):
+            try:
+                st = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            stamp.append((dirpath, name, st.st_ino, st.st_size, st.st_mtime_ns))
+    return stamp
+
+async def serve(dist_path="dist", host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+    """
+    Serve `dist_path` over HTTP until cancelled. Besides the files themselves,
+    GET /bundle?macros=A,B[&common=GCPCommon.puml] returns a single include
+    with just those macros. Responses carry strong ETags, honour
+    If-None-Match with 304, and are gzipped when the client accepts it.
+    `ready`, if given, is called with the bound (host, port).
+    """
+    index = Index(dist_path)
+    server = await asyncio.start_server(lambda r, w: _handle(r, w, index), host, port)
+    if ready:
+        ready(server.sockets[0].getsockname()[:2])
+    async with server:
+        await server.serve_forever()
+
+async def _handle(reader, writer, index):
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            if len(head) > MAX_HEADER_BYTES:
+                break
+            method, target, headers = _parse_request(head)
+            keep_alive = headers.get("connection", "").lower() != "close"
+            # No route reads a request body, but it has to be consumed before the
+            # next request on this connection; one that can't be is closed instead
+            length = headers.get("content-length", "0")
+            if "transfer-encoding" in headers or not length.isdigit() or int(length) > MAX_DISCARD_BYTES:
+                keep_alive = False
+            elif int(length):
+                try:
+                    await reader.readexactly(int(length))
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+            status, extra, resource, gzipped = _respond(index, method, target, headers)
+
+            body = b""
+            lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+            if resource is not None:
+                lines += [f"ETag: {resource.etag_for(gzipped)}", "Cache-Control: no-cache"]
+                if resource.gzip is not None:
+                    lines.append("Vary: Accept-Encoding")
+                if status == 200:
+                    body = resource.gzip if gzipped else resource.body
+                    lines.append(f"Content-Type: {resource.content_type}")
+                    if gzipped:
+                        lines.append("Content-Encoding: gzip")
+            lines += extra
+            lines.append(f"Content-Length: {len(body)}")
+            if not keep_alive:
+                lines.append("Connection: close")
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            if method != "HEAD":
+                writer.write(body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+def _parse_request(head):
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split()
+    method, target = (parts[0], parts[1]) if len(parts) >= 2 else ("", "")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+def _respond(index, method, target, headers):
+    """Return (status, extra header lines, resource or None, gzipped)."""
+    if method not in ("GET", "HEAD"):
+        return 405, ["Allow: GET, HEAD"], None, False
+    index.refresh()
+    url = urlsplit(target)
+    path = unquote(url.path)
+    if path == BUNDLE_PATH:
+        query = parse_qs(url.query)
+        macros = {m for value in query.get("macros", []) for m in value.split(",") if m}
+        unknown = sorted(m for m in macros if m not in index.macros)
+        commons = query.get("common", [])
+        if not macros or unknown or any("/" + c not in index.files for c in commons):
+            return 400, [], None, False
+        resource = index.bundle(macros, commons)
+    else:
+        resource = index.files.get(path) or index.files.get(path.rstrip("/") + "/index.html")
+        if resource is None:
+            return 404, [], None, False
+
+    gzipped = resource.gzip is not None and _accepts_gzip(headers.get("accept-encoding", ""))
+    if _matches(headers.get("if-none-match"), resource):
+        return 304, [], resource, gzipped
+    return 200, [], resource, gzipped
+
+def _accepts_gzip(accept_encoding):
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            q = params.replace(" ", "").removeprefix("q=")
+            try:
+                return not params or float(q) > 0
+            except ValueError:
+                return True
+    return False
+
+def _matches(if_none_match, resource):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, and either representation's tag will do
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return bool(tags & {resource.etag_for(False), resource.etag_for(True)})
+
+def _content_type(path):
+    return CONTENT_TYPES.get(path.suffix) or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+async def load_test(host, port, paths, requests=1000, concurrency=20, revalidate=False, gzip_ok=True):
+    """
+    Fire `requests` GETs for `paths` (round-robin) over `concurrency`
+    keep-alive connections. With `revalidate`, each connection sends back the
+    ETag it last saw for a path, so repeat requests should come back 304.
+    Returns a dict of counts by status, errors, bytes received, elapsed time,
+    requests per second and latency percentiles in seconds.
+    """
+    statuses = {}
+    latencies = []
+    received = 0
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal received, errors
+        etags = {}
+        reader = writer = None
+        for i in counter:
+            path = paths[i % len(paths)]
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                headers = [f"GET {path} HTTP/1.1", f"Host: {host}:{port}"]
+                if gzip_ok:
+                    headers.append("Accept-Encoding: gzip")
+                if revalidate and path in etags:
+                    headers.append(f"If-None-Match: {etags[path]}")
+                start = time.perf_counter()
+                writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+                await writer.drain()
+                status, response_headers = _parse_response(await reader.readuntil(b"\r\n\r\n"))
+                body = await reader.readexactly(int(response_headers.get("content-length", 0)))
+                latencies.append(time.perf_counter() - start)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors += 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+                continue
+            statuses[status] = statuses.get(status, 0) + 1
+            received += len(body)
+            if "etag" in response_headers:
+                etags[path] = response_headers["etag"]
+        if writer is not None:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "statuses": dict(sorted(statuses.items())),
+        "errors": errors,
+        "bytes": received,
+        "elapsed": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": _percentile(latencies, 0.50),
+        "p95": _percentile(latencies, 0.95),
+        "p99": _percentile(latencies, 0.99),
+    }
+
+async def load_test_local(dist_path="dist", paths=None, **options):
+    """Start a server on a free port, load test it, shut it down and return the results."""
+    bound = asyncio.get_running_loop().create_future()
+    server = asyncio.ensure_future(serve(dist_path, port=0, ready=bound.set_result))
+    try:
+        host, port = await asyncio.wait_for(asyncio.shield(bound), timeout=30)
+        return await load_test(host, port, paths or default_paths(dist_path), **options)
+    finally:
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
+
+def default_paths(dist_path="dist", icons=20):
+    """A mix of category all.puml files, single icons and a bundle, as a diagram author would fetch."""
+    manifest = load_manifest(dist_path)
+    paths = ["/GCPCommon.puml"]
+    paths += [f"/{c['all']}" for c in manifest["categories"].values()][:icons]
+    entries = manifest["icons"][::max(1, len(manifest["icons"]) // icons)][:icons]
+    paths += [f"/{e['puml']}" for e in entries]
+    paths.append(f"{BUNDLE_PATH}?macros=" + ",".join(e["target"] for e in entries))
+    return paths
+
+def _parse_response(head):
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
@@ -0,0 +1,206 @@
+import re
+import zlib
+
+import numpy as np
+from PIL import Image
+
+# PlantUML's 6-bit alphabet (AsciiEncoder.encode6bit), not RFC 4648 base64
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
+HEX_DIGITS = "0123456789ABCDEF"
+LINE_LENGTH = 120
+LEVELS = ("4", "8", "16", "4z", "8z", "16z")
+
+_ALPHABET_BYTES = np.frombuffer(ALPHABET.encode("ascii"), dtype=np.uint8)
+_ALPHABET_INDEX = np.full(256, 255, dtype=np.uint8)
+_ALPHABET_INDEX[_ALPHABET_BYTES] = np.arange(64, dtype=np.uint8)
+
+# Short compressed sprites are written on a single line without braces
+SPRITE_RE = re.compile(r"sprite \$(\w+) \[(\d+)x(\d+)/(\d+)(z?)\] (?:\{\n(.*?)\n?\}|(\S+))", re.S)
+
+def gray_levels(image, nb_levels=16):
+    """
+    Quantise an image to PlantUML sprite grey levels (0 is white).
+    Mirrors SpriteGrayLevel: gray = int(.3R + .59G + .11B), level = (255 - gray) * n / 256.
+    """
+    rgb = np.asarray(image.convert("RGB"), dtype=np.float64)
+    gray = (rgb[..., 0] * .3 + rgb[..., 1] * .59 + rgb[..., 2] * .11).astype(np.int32)
+    return ((255 - gray) * nb_levels // 256).astype(np.uint8)
+
+def encode_image(image, name, level="16z"):
+    """
+    Return the sprite block for `image`, formatted like `plantuml -encodesprite <level>`.
+    """
+    if level not in LEVELS:
+        raise ValueError(f"Unknown sprite level: {level}")
+    nb_levels = int(level.rstrip("z"))
+    levels = gray_levels(image, nb_levels)
+    height, width = levels.shape
+
+    if level.endswith("z"):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        data = compressor.compress(levels.tobytes()) + compressor.flush()
+        text = encode64(data)
+        lines = [text[i:i + LINE_LENGTH] for i in range(0, len(text), LINE_LENGTH)]
+        if len(lines) == 1:
+            return f"sprite ${name} [{width}x{height}/{level}] {text}\n\n"
+    else:
+        lines = _encode_plain(levels, nb_levels)
+
+    body = "".join(line + "\n" for line in lines)
+    return f"sprite ${name} [{width}x{height}/{level}] {{\n{body}}}\n\n"
+
+def optimise(image, name, max_error=0.015, levels=LEVELS, sizes=(), level=None, size=None):
+    """
+    Encode `image` as the smallest sprite whose mean grey error stays within
+    `max_error` (0-1) of the image at full size. Candidates are every level
+    in `levels` at the full size and at each smaller entry in `sizes`; a
+    smaller sprite also renders smaller, so sizes are only tried when asked
+    for. `level` or `size` pin that choice instead of searching it.
+    Returns (sprite text, info) where info holds the chosen level and size,
+    its byte size and error, and the bytes of plain 16z at full size.
+    """
+    full = max(image.size)
+    reference = _intensity(gray_levels(image, 256), 256)
+    baseline = encode_image(image, name, "16z")
+
+    candidates = []
+    for s in [size] if size else sorted({full} | {s for s in sizes if s < full}, reverse=True):
+        scaled = image
+        if s < full:
+            scaled = image.copy()
+            scaled.thumbnail((s, s))
+        for lv in [level] if level else levels:
+            text = baseline if (s, lv) == (full, "16z") else encode_image(scaled, name, lv)
+            quantised = _intensity(gray_levels(scaled, int(lv.rstrip("z"))), int(lv.rstrip("z")))
+            if scaled.size != image.size:
+                quantised = np.asarray(Image.fromarray(quantised, "F").resize(image.size, Image.BILINEAR))
+            error = float(np.abs(reference - quantised).mean())
+            candidates.append((text, {"level": lv, "size": s, "bytes": len(text), "error": round(error, 5)}))
+
+    passing = [c for c in candidates if c[1]["error"] <= max_error]
+    if passing:
+        best = min(passing, key=lambda c: c[1]["bytes"])
+    elif level or size:
+        # A pinned choice wins over the threshold; take its closest candidate
+        best = min(candidates, key=lambda c: c[1]["error"])
+    else:
+        best = (baseline, {"level": "16z", "size": full, "bytes": len(baseline), "error": None})
+    best[1]["baseline_bytes"] = len(baseline)
+    return best
+
+def _intensity(levels, nb_levels):
+    return levels.astype(np.float32) / (nb_levels - 1)
+
+def decode_sprite(text):
+    """
+    Parse the first sprite block in `text`.
+    Returns (name, levels, nb_levels) where levels is a (height, width) uint8 array.
+    """
+    m = SPRITE_RE.search(text)
+    if not m:
+        raise ValueError("No sprite block found")
+    name, width, height = m.group(1), int(m.group(2)), int(m.group(3))
+    nb_levels, compressed = int(m.group(4)), bool(m.group(5))
+    if compressed:
+        # Some jar-encoded sprites end before the deflate stream does; missing pixels stay 0
+        data = _inflate(m)
+        levels = np.zeros(width * height, dtype=np.uint8)
+        levels[:len(data)] = np.frombuffer(data, dtype=np.uint8)[:width * height]
+        levels = levels.reshape(height, width)
+    else:
+        levels = _decode_plain((m.group(6) or m.group(7)).split(), nb_levels, width, height)
+    return name, levels, nb_levels
+
+def encode64(data):
+    """PlantUML's base64 variant: custom alphabet, no padding characters."""
+    remainder = len(data) % 3
+    padded = np.frombuffer(bytes(data) + b"\0" * (-len(data) % 3), dtype=np.uint8)
+    triples = padded.reshape(-1, 3).astype(np.uint32)
+    n = (triples[:, 0] << 16) | (triples[:, 1] << 8) | triples[:, 2]
+    sextets = np.stack([n >> 18, n >> 12, n >> 6, n], axis=1) & 63
+    text = _ALPHABET_BYTES[sextets.ravel()].tobytes().decode("ascii")
+    if remainder:
+        text = text[:len(text) - 3 + remainder]
+    return text
+
+def decode64(text):
+    chars = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    sextets = _ALPHABET_INDEX[chars]
+    if (sextets == 255).any():
+        raise ValueError("Invalid character in sprite data")
+    remainder = len(sextets) % 4
+    padded = np.concatenate([sextets, np.zeros(-len(sextets) % 4, dtype=np.uint8)])
+    quads = padded.reshape(-1, 4).astype(np.uint32)
+    n = (quads[:, 0] << 18) | (quads[:, 1] << 12) | (quads[:, 2] << 6) | quads[:, 3]
+    data = np.stack([n >> 16, n >> 8, n], axis=1).astype(np.uint8).tobytes()
+    if remainder:
+        data = data[:len(data) - 4 + remainder]
+    return data
+
+def _inflate(match):
+    text = "".join((match.group(6) or match.group(7)).split())
+    return zlib.decompressobj(-15).decompress(decode64(text))
+
+def _encode_plain(levels, nb_levels):
+    # 16 levels: one hex digit per pixel; 8 and 4 levels pack 2 and 3 rows per character
+    if nb_levels == 16:
+        digits = np.frombuffer(HEX_DIGITS.encode("ascii"), dtype=np.uint8)
+        return [row.tobytes().decode("ascii") for row in digits[levels]]
+    rows_per_line = 2 if nb_levels == 8 else 3
+    bits = 3 if nb_levels == 8 else 2
+    height = levels.shape[0]
+    padded = np.zeros((-(-height // rows_per_line) * rows_per_line, levels.shape[1]), dtype=np.uint8)
+    padded[:height] = levels
+    groups = padded.reshape(-1, rows_per_line, levels.shape[1])
+    values = np.zeros(groups[:, 0].shape, dtype=np.uint8)
+    for r in range(rows_per_line):
+        values = (values << bits) | groups[:, r]
+    return [row.tobytes().decode("ascii") for row in _ALPHABET_BYTES[values]]
+
+def _decode_plain(lines, nb_levels, width, height):
+    if nb_levels == 16:
+        rows = [[int(c, 16) for c in line] for line in lines]
+        return np.array(rows, dtype=np.uint8)[:height, :width]
+    rows_per_line = 2 if nb_levels == 8 else 3
+    bits = 3 if nb_levels == 8 else 2
+    values = _ALPHABET_INDEX[np.frombuffer("".join(lines).encode("ascii"), dtype=np.uint8)]
+    values = values.reshape(len(lines), -1)[:, :width]
+    rows = [(values >> (bits * (rows_per_line - 1 - r))) & (nb_levels - 1) for r in range(rows_per_line)]
+    levels = np.stack(rows, axis=1).reshape(-1, values.shape[1])
+    return levels[:height]
+
+def verify_dist(dist_path):
+    """
+    Check the native encoder against the jar-encoded sprites in `dist_path`.
+    Returns (checked, identical_text, mismatched_names). A sprite counts as a
+    match when it decodes to the same grey levels; the text itself can differ
+    because the jar compresses with its own Zopfli port rather than zlib, and
+    some jar sprites stop short of their last pixels, which are only compared
+    as far as the jar's stream goes.
+    """
+    from .icon import remove_transparency
+
+    checked = identical = 0
+    mismatched = []
+    for puml_file in sorted(dist_path.glob("*/*.puml")):
+        png_file = puml_file.with_suffix(".png")
+        if puml_file.name == "all.puml" or not png_file.exists():
+            continue
+        reference = puml_file.read_text(encoding="utf-8")
+        m = SPRITE_RE.search(reference)
+        if not m:
+            continue
+        name, expected, nb_levels = decode_sprite(reference)
+        level = f"{nb_levels}{m.group(5)}"
+        with Image.open(png_file) as im:
+            text = encode_image(remove_transparency(im), name, level)
+        checked += 1
+        if text.rstrip("\n") == m.group(0):
+            identical += 1
+        _, actual, _ = decode_sprite(text)
+        if m.group(5):
+            decoded = len(_inflate(m))
+            expected, actual = expected.ravel()[:decoded], actual.ravel()[:decoded]
+        if actual.shape != expected.shape or not np.array_equal(actual, expected):
+            mismatched.append(name)
+    return checked, identical, mismatched
@@ -0,0 +1,126 @@
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .manifest import MANIFEST_NAME, load_manifest
+from .sprite import decode_sprite
+
+COMPARE_SIZE = 64
+HASH_SIZE = 32
+HASH_BITS = 8
+BATCH_SIZE = 256
+LABEL_WIDTH = 240
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+_DCT = _dct_matrix(HASH_SIZE)
+
+def verify_visual(previous_dir, current_dir, threshold=0.01, hash_distance=4, sprites=False, sheet=None):
+    """
+    Compare each icon image (or decoded sprite) in `current_dir` with the same
+    file in `previous_dir`. Images are loaded in batches into NumPy arrays and
+    compared by mean absolute pixel difference and by the Hamming distance of
+    their DCT perceptual hashes.
+
+    Returns (compared, changes): the number of pairs compared and a list of
+    dicts for those over `threshold` or `hash_distance`, that changed size, or
+    that exist on one side only. With `sheet`, also writes a contact sheet of
+    previous | current | difference for each changed icon.
+    """
+    pairs, changes = _pairs(Path(previous_dir), Path(current_dir), sprites)
+    load = _load_sprite if sprites else _load_png
+    sheet_rows = []
+    for start in range(0, len(pairs), BATCH_SIZE):
+        batch = pairs[start:start + BATCH_SIZE]
+        prev = [load(p) for _, p, _ in batch]
+        cur = [load(c) for _, _, c in batch]
+        prev_px = np.stack([p[0] for p in prev])
+        cur_px = np.stack([c[0] for c in cur])
+
+        pixel = np.abs(prev_px.astype(np.int16) - cur_px).mean(axis=(1, 2, 3)) / 255
+        distance = (_phash(np.stack([p[1] for p in prev])) != _phash(np.stack([c[1] for c in cur]))).sum(axis=1)
+        resized = np.array([p[2] != c[2] for p, c in zip(prev, cur)])
+
+        for i in np.flatnonzero((pixel > threshold) | (distance > hash_distance) | resized):
+            name = batch[i][0]
+            note = f"size {prev[i][2][0]}x{prev[i][2][1]} -> {cur[i][2][0]}x{cur[i][2][1]}" if resized[i] else ""
+            changes.append({"name": name, "pixel": float(pixel[i]), "hash": int(distance[i]), "note": note})
+            sheet_rows.append((name, prev_px[i], cur_px[i]))
+
+    if sheet and sheet_rows:
+        _contact_sheet(sheet_rows, sheet)
+    return len(pairs), changes
+
+def _pairs(previous_dir, current_dir, sprites):
+    """Matching (name, previous, current) paths, plus changes for one-sided files."""
+    if (current_dir / MANIFEST_NAME).exists():
+        field = "puml" if sprites else "png"
+        current = {e["target"]: e[field] for e in load_manifest(current_dir)["icons"]}
+        if (previous_dir / MANIFEST_NAME).exists():
+            previous = {e["target"]: e[field] for e in load_manifest(previous_dir)["icons"]}
+        else:
+            previous = {name: rel for name, rel in current.items() if (previous_dir / rel).exists()}
+    else:
+        # Plain image directories, e.g. rendered verification diagrams
+        pattern = "**/*.puml" if sprites else "**/*.png"
+        current = {f.relative_to(current_dir).as_posix(): f.relative_to(current_dir).as_posix()
+                   for f in current_dir.glob(pattern)}
+        previous = {f.relative_to(previous_dir).as_posix(): f.relative_to(previous_dir).as_posix()
+                    for f in previous_dir.glob(pattern)}
+
+    pairs = [(name, previous_dir / previous[name], current_dir / rel)
+             for name, rel in sorted(current.items()) if name in previous]
+    changes = [{"name": name, "pixel": None, "hash": None, "note": "added"}
+               for name in sorted(current.keys() - previous.keys())]
+    changes += [{"name": name, "pixel": None, "hash": None, "note": "removed"}
+                for name in sorted(previous.keys() - current.keys())]
+    return pairs, changes
+
+def _load_png(path):
+    with Image.open(path) as im:
+        im.load()
+        size = im.size
+        rgba = im.convert("RGBA")
+    image = Image.new("RGBA", size, (255, 255, 255, 255))
+    image.alpha_composite(rgba)
+    return _normalise(image.convert("RGB"), size)
+
+def _load_sprite(path):
+    _, levels, nb_levels = decode_sprite(Path(path).read_text(encoding="utf-8"))
+    gray = 255 - levels.astype(np.uint16) * 255 // (nb_levels - 1)
+    image = Image.fromarray(gray.astype(np.uint8), "L").convert("RGB")
+    return _normalise(image, image.size)
+
+def _normalise(image, size):
+    """(RGB pixels at COMPARE_SIZE, greyscale at HASH_SIZE, original size) for one image."""
+    pixels = np.asarray(image.resize((COMPARE_SIZE, COMPARE_SIZE), Image.BILINEAR), dtype=np.uint8)
+    gray = np.asarray(image.convert("L").resize((HASH_SIZE, HASH_SIZE), Image.BILINEAR), dtype=np.float32)
+    return pixels, gray, size
+
+def _phash(gray):
+    """64-bit DCT perceptual hash per image, as a (batch, 64) bool array."""
+    dct = np.einsum("ij,bjk,lk->bil", _DCT, gray, _DCT)
+    low = dct[:, :HASH_BITS, :HASH_BITS].reshape(len(gray), -1)
+    # Leave the DC term out of the median so flat brightness shifts don't flip bits
+    return low > np.median(low[:, 1:], axis=1)[:, None]
+
+def _contact_sheet(rows, out_file):
+    """One row per changed icon: label, previous, current and amplified difference."""
+    cell = COMPARE_SIZE
+    sheet = Image.new("RGB", (LABEL_WIDTH + 3 * cell, cell * len(rows)), "white")
+    draw = ImageDraw.Draw(sheet)
+    for row, (name, prev, cur) in enumerate(rows):
+        y = row * cell
+        diff = np.abs(prev.astype(np.int16) - cur).max(axis=2)
+        diff = 255 - np.clip(diff * 4, 0, 255).astype(np.uint8)
+        draw.text((4, y + cell // 2 - 6), name, fill="black")
+        sheet.paste(Image.fromarray(prev), (LABEL_WIDTH, y))
+        sheet.paste(Image.fromarray(cur), (LABEL_WIDTH + cell, y))
+        sheet.paste(Image.fromarray(diff, "L").convert("RGB"), (LABEL_WIDTH + 2 * cell, y))
+    Path(out_file).parent.mkdir(parents=True, exist_ok=True)
+    sheet.save(out_file)
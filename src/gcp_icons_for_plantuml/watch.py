@@ -0,0 +1,210 @@
+import shutil
+import time
+from pathlib import Path
+
+from . import config as config_module
+from . import publish
+from .atlas import GALLERY_DIR, load_thumbnails, write_atlas, write_gallery
+from .builder import (create_category_all_file, icon_outputs, image_variants, markdown_rows, render_icon,
+                      render_params, write_markdown)
+from .cache import BuildCache
+from .encoder import get_encoder
+from .icon import Icon
+from .manifest import load_manifest, write_manifest
+from .publish import write_file
+
+SOURCE_DIR = Path("source")
+DEFAULT_INTERVAL = 0.1
+DEFAULT_DEBOUNCE = 0.25
+
+def snapshot():
+    """(mtime_ns, size) of every watched input: source PNGs, source/*.puml and config.yml."""
+    files = list((SOURCE_DIR / "official").glob("**/*.png")) + list(SOURCE_DIR.glob("*.puml"))
+    files.append(config_module.CONFIG_PATH)
+    stamps = {}
+    for f in files:
+        try:
+            st = f.stat()
+        except OSError:
+            continue
+        stamps[str(f)] = (st.st_mtime_ns, st.st_size)
+    return stamps
+
+class Watcher:
+    """
+    Keeps dist/ in step with its inputs from a warm process that already holds
+    the compiled config, the encoder, every icon's manifest record and the
+    atlas thumbnails.
+
+    Changes are traced through the dependency graph the build implies:
+      config.yml entry (SourceDir, Source) -> that source PNG's icon
+      Defaults TargetMaxSize/TargetSizes   -> every icon
+      source PNG -> its images and .puml, its category's all.puml and
+                    GCPSymbols.md rows
+      source/*.puml -> its copy in dist/
+    and only those outputs are rewritten. The manifest, atlas and build state
+    are updated too, so a later `build` finds nothing to do. Like a build, each
+    update is made in a staging tree and swapped in for dist/ whole.
+    """
+
+    def __init__(self, encoder="auto", use_cache=True, optimise_sprites=False, binary_manifest=False,
+                 keep_generations=publish.KEEP_GENERATIONS):
+        self.dist_path = Path("dist")
+        self.keep_generations = keep_generations
+        self.encoder = encoder
+        self.use_cache = use_cache
+        self.optimise = optimise_sprites
+        self.binary_manifest = binary_manifest
+        self.cache = BuildCache()
+        self.thumbnails = {}
+
+    def load(self):
+        """Warm up from the build in dist/."""
+        self.config = config_module.load()
+        self.variants = image_variants(self.config)
+        self.params = render_params(self.variants, self.encoder, self.optimise)
+        manifest = load_manifest(self.dist_path)
+        self.records = {r["source"]: r for r in manifest["icons"]}
+        self.categories = dict(manifest["categories"])
+        self.state = self.cache.load_state()
+        self.icons = {source: Icon(source, self.config) for source in self.records}
+        self.rows = {}
+        for c in self.categories:
+            self.rows[c] = markdown_rows(c, [i for i in self.icons.values() if i.category == c])
+        self.snapshot = snapshot()
+        get_encoder(self.encoder)
+        load_thumbnails(self.records.values(), self.dist_path, thumbnails=self.thumbnails)
+
+    def update(self, current):
+        """
+        Rebuild whatever depends on the inputs that differ between the last
+        snapshot and `current`. Returns a list of failures like `build_all`.
+        """
+        changed = {p for p in self.snapshot.keys() | current.keys() if self.snapshot.get(p) != current.get(p)}
+        self.snapshot = current
+        sources = {p for p in current if p.endswith(".png")}
+
+        dirty = {p for p in changed if p in sources}
+        old_variants = self.variants
+        if str(config_module.CONFIG_PATH) in changed:
+            try:
+                self.config = config_module.load()
+            except Exception as e:
+                print(f"Error loading config.yml: {e}")
+                return []
+            self.variants = image_variants(self.config)
+            self.params = render_params(self.variants, self.encoder, self.optimise)
+            for source in sources:
+                old = self.icons.get(source)
+                if old is None or self.variants != old_variants or _entry(old) != _entry(Icon(source, self.config)):
+                    dirty.add(source)
+
+        dist_path = publish.stage(self.dist_path, reuse=True)
+        for common in sorted(p for p in changed if p.endswith(".puml") and p in current):
+            write_file(dist_path / Path(common).name, Path(common).read_bytes())
+
+        touched = set()
+        failures = []
+        for source in sorted(set(self.records) - sources):
+            # Deleted or renamed source
+            old = self.icons.pop(source)
+            for f in icon_outputs(old, dist_path, old_variants):
+                f.unlink(missing_ok=True)
+            self.records.pop(source)
+            self.state.pop(source, None)
+            touched.add(old.category)
+
+        for source in sorted(dirty):
+            icon = Icon(source, self.config)
+            outputs = icon_outputs(icon, dist_path, self.variants)
+            old = self.icons.get(source)
+            if old is not None:
+                for f in set(icon_outputs(old, dist_path, old_variants)) - set(outputs):
+                    f.unlink(missing_ok=True)
+                touched.add(old.category)
+            touched.add(icon.category)
+            key = self.cache.key(icon, self.params)
+            try:
+                (dist_path / icon.category).mkdir(parents=True, exist_ok=True)
+                if self.use_cache and self.cache.lookup(key):
+                    record = self.cache.restore(key, dist_path / icon.category)
+                else:
+                    record = render_icon(icon, self.variants, self.encoder, self.use_cache, self.optimise,
+                                         dist_path)
+                    self.cache.store(key, outputs, record)
+            except Exception as e:
+                failures.append({"source": source, "target": icon.target, "error": str(e)})
+                for f in outputs:
+                    f.unlink(missing_ok=True)
+                self.records.pop(source, None)
+                self.state.pop(source, None)
+                self.icons.pop(source, None)
+                continue
+            self.records[source] = record
+            self.icons[source] = icon
+            self.state[source] = {"key": key, "outputs": [f.relative_to(dist_path).as_posix() for f in outputs]}
+
+        for c in sorted(touched):
+            records = [r for r in self.records.values() if r["category"] == c]
+            if records:
+                digest = create_category_all_file(dist_path / c, records)
+                self.categories[c] = {"all": f"{c}/all.puml", "sha256": digest}
+                self.rows[c] = markdown_rows(c, [i for i in self.icons.values() if i.category == c])
+            else:
+                shutil.rmtree(dist_path / c, ignore_errors=True)
+                self.categories.pop(c, None)
+                self.rows.pop(c, None)
+
+        if touched:
+            write_markdown(self.rows, dist_path)
+            write_manifest(self.records.values(), self.categories, dist_path, binary=self.binary_manifest)
+            atlas = write_atlas(self.records.values(), dist_path, thumbnails=self.thumbnails)
+            if (dist_path / GALLERY_DIR).exists():
+                write_gallery(atlas, dist_path)
+            self._trim_thumbnails()
+        publish.publish(dist_path, self.dist_path, keep=self.keep_generations)
+        if touched:
+            self.cache.save_state(self.state)
+        return failures
+
+    def _trim_thumbnails(self):
+        live = {r["sha256"].get(r["png"]) for r in self.records.values()}
+        for key in [k for k in self.thumbnails if k[0] not in live]:
+            del self.thumbnails[key]
+
+def _entry(icon):
+    return (icon.category, icon.target, icon.color, icon.sprite_options)
+
+def watch(encoder="auto", use_cache=True, optimise_sprites=False, binary_manifest=False,
+          keep_generations=publish.KEEP_GENERATIONS, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+    """
+    Poll the build inputs every `interval` seconds and, once they have been
+    quiet for `debounce` seconds, rebuild what the change affects. Runs until
+    interrupted; expects dist/ to hold a finished build.
+    """
+    watcher = Watcher(encoder, use_cache=use_cache, optimise_sprites=optimise_sprites,
+                      binary_manifest=binary_manifest, keep_generations=keep_generations)
+    watcher.load()
+    print("Watching source/official, source/*.puml and scripts/config.yml (Ctrl+C to stop).")
+    while True:
+        time.sleep(interval)
+        current = snapshot()
+        if current == watcher.snapshot:
+            continue
+        # Let a burst of saves (an editor, a copy of many files) settle first
+        settled = time.monotonic()
+        while time.monotonic() - settled < debounce:
+            time.sleep(interval)
+            latest = snapshot()
+            if latest != current:
+                current, settled = latest, time.monotonic()
+
+        start = time.perf_counter()
+        before = dict(watcher.records)
+        failures = watcher.update(current)
+        rebuilt = sum(1 for s, r in watcher.records.items() if before.get(s) is not r)
+        removed = len(before.keys() - watcher.records.keys() - {f["source"] for f in failures})
+        print(f"[{time.strftime('%H:%M:%S')}] {rebuilt} icon(s) rebuilt, {removed} removed "
+              f"in {time.perf_counter() - start:.2f}s.")
+        for f in failures:
+            print(f"  {f['source']} ({f['target']}): {f['error']}")
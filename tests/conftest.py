@@ -0,0 +1,71 @@
+import shutil
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageDraw
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CONFIG = """\
+Defaults:
+  Colors:
+    GoogleBlue: "#4284F3"
+    GoogleRed: "#EA4335"
+  Category:
+    Color: GoogleBlue
+  TargetMaxSize: 64
+  TargetSizes: [32]
+Categories:
+  - Name: compute
+    SourceDir: Compute
+    Services:
+      - Source: compute-engine.png
+        Target: compute_engine
+      - Source: gke.png
+        Target: gke
+  - Name: storage
+    SourceDir: Storage
+    Color: GoogleRed
+    Services:
+      - Source: cloud-storage.png
+        Target: cloud_storage
+"""
+
+# Source PNG (relative to source/official) -> fill colour
+ICONS = {
+    "Compute/compute-engine.png": (66, 133, 244),
+    "Compute/gke.png": (15, 157, 88),
+    "Storage/cloud-storage.png": (234, 67, 53),
+}
+
+def draw_icon(path, color, size=96):
+    """A transparent PNG holding a filled circle, like the official icons."""
+    im = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    ImageDraw.Draw(im).ellipse((8, 8, size - 8, size - 8), fill=color + (255,))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    im.save(path)
+
+def dist_files(root):
+    """Every file under root/dist, dist-relative path -> bytes."""
+    return {p.relative_to(root / "dist").as_posix(): p.read_bytes() for p in (root / "dist").rglob("*") if p.is_file()}
+
+@pytest.fixture
+def source_tree(tmp_path, monkeypatch):
+    """A checkout with a three-icon source/official and config.yml, as the working directory."""
+    (tmp_path / "scripts").mkdir()
+    (tmp_path / "scripts" / "config.yml").write_text(CONFIG, encoding="utf-8")
+    (tmp_path / "source").mkdir()
+    for common in (ROOT / "source").glob("*.puml"):
+        shutil.copy(common, tmp_path / "source" / common.name)
+    for rel, color in ICONS.items():
+        draw_icon(tmp_path / "source" / "official" / rel, color)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def built_tree(source_tree):
+    """`source_tree` after a native-encoder build into dist/."""
+    from gcp_icons_for_plantuml.builder import build_all
+
+    assert build_all(encoder="native", jobs=1) == []
+    return source_tree
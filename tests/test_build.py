@@ -0,0 +1,63 @@
+import json
+import re
+
+from conftest import dist_files, draw_icon
+
+from gcp_icons_for_plantuml.builder import build_all
+
+def build(capsys):
+    """Build with the native encoder; return the (hits, misses) it reported."""
+    capsys.readouterr()
+    assert build_all(encoder="native", jobs=1) == []
+    m = re.search(r"Build cache: (\d+) hits, (\d+) misses", capsys.readouterr().out)
+    return int(m.group(1)), int(m.group(2))
+
+def manifest_targets(root):
+    manifest = json.loads((root / "dist" / "manifest.json").read_text(encoding="utf-8"))
+    return sorted(icon["target"] for icon in manifest["icons"])
+
+def test_unchanged_rebuild_is_all_hits(built_tree, capsys):
+    before = dist_files(built_tree)
+
+    assert build(capsys) == (3, 0)
+    assert dist_files(built_tree) == before
+
+def test_changed_icon_is_the_only_miss(built_tree, capsys):
+    before = dist_files(built_tree)
+    draw_icon(built_tree / "source" / "official" / "Compute" / "gke.png", (244, 180, 0))
+
+    assert build(capsys) == (2, 1)
+    after = dist_files(built_tree)
+    changed = {f for f in before.keys() | after.keys() if before.get(f) != after.get(f)}
+    # The icon's own outputs, its category's all.puml and the files that list every icon
+    assert {f for f in changed if "/" in f} == {
+        "compute/gke.png", "compute/gke_32.png", "compute/gke_opaque.png", "compute/gke.puml", "compute/all.puml"}
+    assert changed - {f for f in changed if "/" in f} <= {"manifest.json", "atlas.json", "atlas.png", "atlas.webp"}
+
+def test_edit_then_revert_restores_from_cache(built_tree, capsys):
+    icon = built_tree / "source" / "official" / "Compute" / "gke.png"
+    original = icon.read_bytes()
+    before = dist_files(built_tree)
+    draw_icon(icon, (244, 180, 0))
+    build(capsys)
+
+    icon.write_bytes(original)
+    assert build(capsys) == (3, 0)
+    assert dist_files(built_tree) == before
+
+def test_removed_icon_outputs_are_cleaned_up(built_tree, capsys):
+    (built_tree / "source" / "official" / "Compute" / "gke.png").unlink()
+
+    assert build(capsys) == (2, 0)
+    files = dist_files(built_tree)
+    assert not [f for f in files if f.startswith("compute/gke")]
+    assert "gke" not in files["compute/all.puml"].decode("utf-8")
+    assert "gke" not in files["GCPSymbols.md"].decode("utf-8")
+    assert manifest_targets(built_tree) == ["cloud_storage", "compute_engine"]
+
+def test_emptied_category_is_removed(built_tree, capsys):
+    (built_tree / "source" / "official" / "Storage" / "cloud-storage.png").unlink()
+
+    build(capsys)
+    assert not (built_tree / "dist" / "storage").exists()
+    assert manifest_targets(built_tree) == ["compute_engine", "gke"]
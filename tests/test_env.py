@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from gcp_icons_for_plantuml import encoder
+from gcp_icons_for_plantuml.env import check_encoder
+
+def test_encoder_check_is_cached_until_the_jar_changes(tmp_path, monkeypatch):
+    jar = tmp_path / "plantuml.jar"
+    jar.write_bytes(b"jar")
+    cache = tmp_path / "plantuml-version.json"
+    checked = []
+    monkeypatch.setattr(encoder, "check_jar_encoder", checked.append)
+
+    check_encoder(jar, cache)
+    check_encoder(jar, cache)
+    assert checked == [jar]
+
+    st = jar.stat()
+    os.utime(jar, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    check_encoder(jar, cache)
+    assert checked == [jar, jar]
+
+def test_failed_encoder_check_is_not_cached(tmp_path, monkeypatch):
+    jar = tmp_path / "plantuml.jar"
+    jar.write_bytes(b"jar")
+    cache = tmp_path / "plantuml-version.json"
+    calls = []
+
+    def broken(path):
+        calls.append(path)
+        raise encoder.EncoderError("no server")
+
+    monkeypatch.setattr(encoder, "check_jar_encoder", broken)
+    for _ in range(2):
+        with pytest.raises(encoder.EncoderError):
+            check_encoder(jar, cache)
+    assert len(calls) == 2
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from gcp_icons_for_plantuml.fetcher import download_zip, sync_official
+
+BODY = bytes(range(256)) * 64
+ETAG = '"v1"'
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Serves the server's `body` with an ETag, honouring If-None-Match and Range/If-Range."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        body = server.body
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+        status, start = 200, 0
+        if self.headers.get("Range") and self.headers.get("If-Range") == ETAG:
+            start = int(self.headers["Range"].removeprefix("bytes=").rstrip("-"))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body) - start))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def archive_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+    server.body = BODY
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/icons.zip"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def cached(cache_dir, url):
+    stem = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return cache_dir / f"{stem}.zip", cache_dir / f"{stem}.zip.part", cache_dir / f"{stem}.json"
+
+def interrupted(cache_dir, url, data):
+    """Leave the cache as a download of `url` that stopped after `data`."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    _, part_path, meta_path = cached(cache_dir, url)
+    part_path.write_bytes(data)
+    meta_path.write_text(json.dumps({"partial": {"etag": ETAG, "last_modified": None}}), encoding="utf-8")
+
+def test_complete_part_left_unpromoted_is_promoted_on_416(archive_server, tmp_path):
+    # The previous run wrote the last byte but died before renaming the .part
+    interrupted(tmp_path, archive_server.url, BODY)
+
+    zip_path = download_zip(archive_server.url, cache_dir=tmp_path)
+
+    assert zip_path.read_bytes() == BODY
+    assert len(archive_server.requests) == 1
+    _, part_path, meta_path = cached(tmp_path, archive_server.url)
+    assert not part_path.exists()
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    assert meta["etag"] == ETAG and "partial" not in meta
+
+def test_part_longer_than_the_remote_file_restarts_without_range(archive_server, tmp_path):
+    interrupted(tmp_path, archive_server.url, BODY + b"stale tail")
+
+    zip_path = download_zip(archive_server.url, cache_dir=tmp_path)
+
+    assert zip_path.read_bytes() == BODY
+    assert [r.get("Range") for r in archive_server.requests] == [f"bytes={len(BODY) + 10}-", None]
+    # And the next run just revalidates
+    download_zip(archive_server.url, cache_dir=tmp_path)
+    assert archive_server.requests[-1].get("If-None-Match") == ETAG
+
+def test_first_download_is_cached_with_its_validators(archive_server, tmp_path):
+    zip_path = download_zip(archive_server.url, cache_dir=tmp_path)
+
+    assert zip_path.read_bytes() == BODY
+    _, part_path, meta_path = cached(tmp_path, archive_server.url)
+    assert not part_path.exists()
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    assert meta["etag"] == ETAG and meta["size"] == len(BODY)
+
+def test_unchanged_archive_is_revalidated_with_304(archive_server, tmp_path):
+    zip_path = download_zip(archive_server.url, cache_dir=tmp_path)
+    mtime = zip_path.stat().st_mtime_ns
+
+    assert download_zip(archive_server.url, cache_dir=tmp_path) == zip_path
+
+    assert archive_server.requests[-1]["If-None-Match"] == ETAG
+    assert zip_path.stat().st_mtime_ns == mtime
+
+def test_offline_uses_the_cache_without_the_network(archive_server, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        download_zip(archive_server.url, offline=True, cache_dir=tmp_path)
+    zip_path = download_zip(archive_server.url, cache_dir=tmp_path)
+    sent = len(archive_server.requests)
+
+    assert download_zip(archive_server.url, offline=True, cache_dir=tmp_path) == zip_path
+    assert len(archive_server.requests) == sent
+
+def test_interrupted_download_resumes_with_range_and_if_range(archive_server, tmp_path):
+    interrupted(tmp_path, archive_server.url, BODY[:1000])
+
+    zip_path = download_zip(archive_server.url, cache_dir=tmp_path)
+
+    assert zip_path.read_bytes() == BODY
+    request = archive_server.requests[-1]
+    assert request["Range"] == "bytes=1000-" and request["If-Range"] == ETAG
+    assert not cached(tmp_path, archive_server.url)[1].exists()
+
+def test_resume_restarts_when_the_archive_changed(archive_server, tmp_path):
+    # If-Range doesn't match, so the server sends the whole new archive
+    interrupted(tmp_path, archive_server.url, BODY[:1000])
+    meta_path = cached(tmp_path, archive_server.url)[2]
+    meta_path.write_text(json.dumps({"partial": {"etag": '"v0"', "last_modified": None}}), encoding="utf-8")
+
+    zip_path = download_zip(archive_server.url, cache_dir=tmp_path)
+
+    assert zip_path.read_bytes() == BODY
+    assert archive_server.requests[0]["If-Range"] == '"v0"'
+
+def icon_zip(path, members):
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return path
+
+def test_sync_adds_changes_removes_and_skips(tmp_path):
+    official = tmp_path / "official"
+    first = icon_zip(tmp_path / "v1.zip", {
+        "Compute/compute.png": b"compute v1",
+        "Storage/storage.png": b"storage",
+        "Storage/old.png": b"old",
+    })
+    report = sync_official(first, official)
+    assert sorted(report.added) == ["Compute/compute.png", "Storage/old.png", "Storage/storage.png"]
+    unchanged = official / "Storage" / "storage.png"
+    mtime = unchanged.stat().st_mtime_ns
+
+    second = icon_zip(tmp_path / "v2.zip", {
+        "Compute/compute.png": b"compute v2",
+        "Storage/storage.png": b"storage",
+        "Network/vpc.png": b"vpc",
+        # None of these belong in source/official
+        "__MACOSX/Network/._vpc.png": b"fork",
+        "Network/._vpc.png": b"fork",
+        "Network/vpc.svg": b"<svg/>",
+        "../escape.png": b"nope",
+    })
+    report = sync_official(second, official)
+
+    assert report.added == ["Network/vpc.png"]
+    assert report.changed == ["Compute/compute.png"]
+    assert report.removed == ["Storage/old.png"]
+    assert report.unchanged == 1
+    assert (official / "Compute" / "compute.png").read_bytes() == b"compute v2"
+    assert unchanged.stat().st_mtime_ns == mtime
+    assert sorted(p.relative_to(official).as_posix() for p in official.rglob("*") if p.is_file()) == [
+        "Compute/compute.png", "Network/vpc.png", "Storage/storage.png"]
+    assert not (tmp_path / "escape.png").exists()
+
+def test_sync_prunes_emptied_directories(tmp_path):
+    official = tmp_path / "official"
+    sync_official(icon_zip(tmp_path / "v1.zip", {"Gone/a.png": b"a", "Kept/b.png": b"b"}), official)
+    report = sync_official(icon_zip(tmp_path / "v2.zip", {"Kept/b.png": b"b"}), official)
+
+    assert report.removed == ["Gone/a.png"]
+    assert not (official / "Gone").exists()
@@ -0,0 +1,30 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from gcp_icons_for_plantuml.encoder import PersistentJarEncoder, jar_available
+
+ROOT = Path(__file__).resolve().parent.parent
+JAR = ROOT / "scripts" / "plantuml.jar"
+ICONS = sorted((ROOT / "dist").glob("*/*.png"))[:5]
+LEVELS = ("16z", "16", "8z", "4")
+
+pytestmark = pytest.mark.skipif(not jar_available(JAR), reason="needs java and scripts/plantuml.jar")
+
+@pytest.fixture(scope="module")
+def server():
+    encoder = PersistentJarEncoder(JAR).start()
+    yield encoder
+    encoder.close()
+
+@pytest.mark.parametrize("level", LEVELS)
+@pytest.mark.parametrize("png_file", ICONS, ids=lambda p: p.stem)
+def test_server_matches_encodesprite(server, png_file, level):
+    expected = subprocess.run(
+        ["java", "-jar", str(JAR), "-encodesprite", level, str(png_file)],
+        capture_output=True,
+        check=True,
+    ).stdout.decode("UTF-8")
+    assert server.encode(png_file, png_file.stem, level) == expected
+    assert server.encode_bytes(png_file.read_bytes(), png_file.stem, level) == expected
@@ -0,0 +1,11 @@
+from conftest import dist_files
+
+from gcp_icons_for_plantuml.library import build_library
+
+def test_library_matches_the_build(built_tree):
+    library = build_library(encoder="native")
+    built = dist_files(built_tree)
+
+    assert library.failures == []
+    assert {path: built[path] for path in library.files} == library.files
+    assert [r["target"] for r in library] == ["compute_engine", "gke", "cloud_storage"]
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+from conftest import draw_icon
+
+from gcp_icons_for_plantuml import builder, publish
+from gcp_icons_for_plantuml.builder import build_all
+from gcp_icons_for_plantuml.watch import Watcher, snapshot
+
+GKE_PUML = "compute/gke.puml"
+
+def recolour_gke(root, color):
+    draw_icon(root / "source" / "official" / "Compute" / "gke.png", color)
+
+def rebuild(**options):
+    assert build_all(encoder="native", jobs=1, **options) == []
+
+def names(paths):
+    return [p.name for p in paths]
+
+def test_first_build_publishes_a_real_directory(built_tree):
+    dist = built_tree / "dist"
+    assert dist.is_dir() and not dist.is_symlink()
+    assert publish.generations(dist) == []
+    # Nothing changed, so nothing is published and no generation kept
+    rebuild()
+    assert publish.generations(dist) == []
+    assert not (built_tree / ".dist" / "staging").exists()
+
+def test_changed_build_keeps_the_previous_tree_as_a_generation(built_tree):
+    dist = built_tree / "dist"
+    old_puml = (dist / GKE_PUML).read_bytes()
+    recolour_gke(built_tree, (244, 180, 0))
+
+    rebuild()
+    generation, = publish.generations(dist)
+    assert generation.name == "gen-000001"
+    assert (generation / GKE_PUML).read_bytes() == old_puml
+    assert (dist / GKE_PUML).read_bytes() != old_puml
+    assert not dist.is_symlink()
+    # Unchanged files are shared with the generation, not stored twice
+    common = "storage/cloud_storage.puml"
+    assert (dist / common).stat().st_ino == (generation / common).stat().st_ino
+
+def test_rollback_swaps_a_generation_back_in(built_tree):
+    dist = built_tree / "dist"
+    first = (dist / GKE_PUML).read_bytes()
+    recolour_gke(built_tree, (244, 180, 0))
+    rebuild()
+    second = (dist / GKE_PUML).read_bytes()
+
+    restored, replaced = builder.rollback()
+    assert restored == "gen-000001" and replaced.name == "gen-000002"
+    assert (dist / GKE_PUML).read_bytes() == first
+    assert (replaced / GKE_PUML).read_bytes() == second
+    assert names(publish.generations(dist)) == ["gen-000002"]
+    # The build state described the rolled-back outputs, so it's dropped
+    assert not (built_tree / ".cache" / "build" / "state.json").exists()
+
+    # ...and the rollback can itself be undone
+    builder.rollback("gen-000002")
+    assert (dist / GKE_PUML).read_bytes() == second
+
+    with pytest.raises(ValueError):
+        builder.rollback("gen-999999")
+
+def test_old_generations_are_pruned(built_tree):
+    for color in ((244, 180, 0), (0, 0, 0), (255, 255, 255)):
+        recolour_gke(built_tree, color)
+        rebuild(keep_generations=2)
+    assert names(publish.generations(built_tree / "dist")) == ["gen-000002", "gen-000003"]
+
+def test_write_file_leaves_other_links_alone(tmp_path):
+    published = tmp_path / "published.txt"
+    published.write_bytes(b"old")
+    staged = tmp_path / "staged.txt"
+    os.link(published, staged)
+
+    publish.write_file(staged, b"new")
+    assert staged.read_bytes() == b"new"
+    assert published.read_bytes() == b"old"
+
+def test_watcher_publishes_each_update(built_tree):
+    dist = built_tree / "dist"
+    watcher = Watcher(encoder="native")
+    watcher.load()
+
+    (built_tree / "source" / "official" / "Compute" / "gke.png").unlink()
+    assert watcher.update(snapshot()) == []
+    assert not [p for p in (dist / "compute").iterdir() if p.name.startswith("gke")]
+    assert "gke" not in (dist / "compute" / "all.puml").read_text(encoding="utf-8")
+    generation, = publish.generations(dist)
+    assert (generation / GKE_PUML).exists()
+    assert not (built_tree / ".dist" / "staging").exists()
+
+    # Its state matches dist/, so a build finds nothing to do
+    rebuild()
+    assert names(publish.generations(dist)) == ["gen-000001"]
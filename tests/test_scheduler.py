@@ -0,0 +1,27 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+from gcp_icons_for_plantuml.scheduler import run_pipeline
+
+def _double(n):
+    if n == 3:
+        # A worker dying outright, as when the OOM killer takes it
+        os._exit(1)
+    return n * 2
+
+def _add_one(n):
+    return n + 1
+
+def test_a_dead_worker_fails_its_items_and_the_rest_carry_on():
+    items = list(range(20))
+    results, errors = {}, {}
+    run_pipeline(items, [("double", _double, 2), ("add", _add_one, 2)],
+                 on_result=results.__setitem__,
+                 on_error=lambda item, stage, exc: errors.__setitem__(item, (stage, exc)))
+
+    assert errors[3][0] == "double"
+    assert all(isinstance(exc, BrokenProcessPool) for _, exc in errors.values())
+    assert results.keys() | errors.keys() == set(items)
+    assert all(results[n] == n * 2 + 1 for n in results)
+    # Items queued behind the crash run in the replacement pool
+    assert max(results) == 19
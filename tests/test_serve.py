@@ -0,0 +1,109 @@
+import asyncio
+import gzip
+import http.client
+import re
+import socket
+import threading
+
+import pytest
+
+from gcp_icons_for_plantuml.serve import serve
+
+@pytest.fixture
+def server(built_tree):
+    """(host, port) of `serve` on the built dist/, on a free port in a background thread."""
+    loop = asyncio.new_event_loop()
+    bound = threading.Event()
+    address = []
+
+    def ready(addr):
+        address.extend(addr)
+        bound.set()
+
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    running = asyncio.run_coroutine_threadsafe(serve("dist", port=0, ready=ready), loop)
+    assert bound.wait(10)
+    yield address[0], address[1]
+    # Let the server and any open connections unwind before the loop goes
+    running.cancel()
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0.1), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    loop.close()
+
+def get(server, path, **headers):
+    conn = http.client.HTTPConnection(*server, timeout=10)
+    conn.request("GET", path, headers=headers)
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response, body
+
+def test_etag_revalidates_with_304(server, built_tree):
+    response, body = get(server, "/GCPCommon.puml")
+    assert response.status == 200
+    assert body == (built_tree / "dist" / "GCPCommon.puml").read_bytes()
+    etag = response.getheader("ETag")
+
+    response, body = get(server, "/GCPCommon.puml", **{"If-None-Match": etag})
+    assert response.status == 304
+    assert body == b""
+    assert response.getheader("ETag") == etag
+
+def test_gzip_only_when_accepted(server, built_tree):
+    expected = (built_tree / "dist" / "GCPCommon.puml").read_bytes()
+
+    plain, body = get(server, "/GCPCommon.puml")
+    assert plain.getheader("Content-Encoding") is None
+    assert body == expected
+
+    packed, body = get(server, "/GCPCommon.puml", **{"Accept-Encoding": "br, gzip"})
+    assert packed.getheader("Content-Encoding") == "gzip"
+    assert packed.getheader("Vary") == "Accept-Encoding"
+    assert gzip.decompress(body) == expected
+    # Each representation has its own ETag, and either revalidates
+    assert packed.getheader("ETag") != plain.getheader("ETag")
+    response, _ = get(server, "/GCPCommon.puml", **{"Accept-Encoding": "gzip", "If-None-Match": plain.getheader("ETag")})
+    assert response.status == 304
+
+    refused, body = get(server, "/GCPCommon.puml", **{"Accept-Encoding": "gzip;q=0"})
+    assert refused.getheader("Content-Encoding") is None
+    assert body == expected
+
+def test_bundle_route(server, built_tree):
+    response, body = get(server, "/bundle?macros=gke,cloud_storage")
+    assert response.status == 200
+    text = body.decode("utf-8")
+    assert text.startswith((built_tree / "dist" / "GCPCommon.puml").read_text(encoding="utf-8").rstrip("\n"))
+    assert "sprite $gke " in text and "sprite $cloud_storage " in text
+    assert "sprite $compute_engine " not in text
+
+    response, body = get(server, "/bundle?macros=gke&common=GCPRaw.puml")
+    assert response.status == 200
+    assert body.decode("utf-8").startswith((built_tree / "dist" / "GCPRaw.puml").read_text(encoding="utf-8").rstrip("\n"))
+
+    for bad in ("/bundle", "/bundle?macros=no_such_icon", "/bundle?macros=gke&common=missing.puml"):
+        assert get(server, bad)[0].status == 400
+
+def test_unknown_path_is_404(server):
+    assert get(server, "/no/such/file.puml")[0].status == 404
+
+def exchange(server, data):
+    """Send raw request bytes on one connection; return the status of every response until it closes."""
+    with socket.create_connection(server, timeout=10) as sock:
+        sock.sendall(data)
+        received = b""
+        while chunk := sock.recv(65536):
+            received += chunk
+    return [int(status) for status in re.findall(rb"^HTTP/1.1 (\d+) ", received, re.MULTILINE)]
+
+def test_request_body_is_not_read_as_the_next_request(server):
+    body = b"GET /no/such/file.puml HTTP/1.1\r\n\r\n"
+    post = b"POST /GCPCommon.puml HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+    get_and_close = b"GET /GCPCommon.puml HTTP/1.1\r\nConnection: close\r\n\r\n"
+    assert exchange(server, post + get_and_close) == [405, 200]
+
+    # A body it can't measure ends the connection instead
+    chunked = b"POST /GCPCommon.puml HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n" + b"0\r\n\r\n"
+    assert exchange(server, chunked + get_and_close) == [405]
@@ -0,0 +1,16 @@
+from pathlib import Path
+
+from gcp_icons_for_plantuml.sprite import verify_dist
+
+DIST = Path(__file__).resolve().parent.parent / "dist"
+
+def test_native_sprites_decode_like_the_published_ones():
+    # dist/ holds the jar-encoded sprites; native text may differ, pixels may not
+    checked, identical, mismatched = verify_dist(DIST)
+    assert checked > 0
+    assert mismatched == []
+
+def test_native_build_sprites_are_reproduced_exactly(built_tree):
+    checked, identical, mismatched = verify_dist(built_tree / "dist")
+    assert checked == identical == 3
+    assert mismatched == []
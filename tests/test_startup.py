@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from gcp_icons_for_plantuml.benchmark import startup_imports, startup_time
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+# Seconds a bare `--help` may take on top of starting the interpreter itself
+STARTUP_OVERHEAD_BUDGET = 0.2
+
+@pytest.fixture(autouse=True)
+def importable_cli(monkeypatch):
+    # The timings run the CLI in a fresh interpreter, which needs to find this checkout
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(filter(None, [str(SRC), os.environ.get("PYTHONPATH")])))
+
+def interpreter_time(repeat=5):
+    """Fastest wall time of `python -c pass`, the floor under any CLI timing."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def test_help_imports_no_heavy_dependencies():
+    assert startup_imports() == []
+
+def test_help_starts_within_budget():
+    baseline = interpreter_time()
+    help_time = startup_time(repeat=5)
+    print(f"--help {help_time:.3f}s, bare interpreter {baseline:.3f}s")
+    assert help_time - baseline < STARTUP_OVERHEAD_BUDGET